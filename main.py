@@ -26,8 +26,8 @@ db = DatabaseHandler('data/database.db')
 db.create_and_connect()
 recordings = api.search_api("Turdus merula", cnt="Germany")
 
+api.download_recordings(recordings[:100], database=db)
 for record in recordings[:100]:
-    api.download_recording(record)
     db.upload_recording(record)
 
 
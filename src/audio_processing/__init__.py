@@ -1 +1,4 @@
 from .noise_reduction import *
+from .streaming import *
+from .pipeline import *
+from .segmentation import *
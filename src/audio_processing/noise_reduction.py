@@ -1,17 +1,157 @@
 import numpy as np
 import librosa
 import matplotlib.pyplot as plt
+from functools import lru_cache
 from scipy.ndimage.filters import gaussian_filter
 import scipy.signal as signal
+from scipy.ndimage import minimum_filter1d
 
-def spectral_substraction(noise_sample, y, sr, factor = 1, smoothing = None, return_audio = False):
+from .streaming import StreamingSTFT
+
+def estimate_noise_floor(power, method = 'percentile', percentile = 10,
+                         alpha = 0.85, window_frames = 64, bias = 2.0):
+    """
+    Estimates the noise floor of a power spectrogram without a manually
+    selected noise sample, in a single vectorized pass.
+    Parameters
+    ----------
+    power
+        Power spectrogram, shape (n_bins, n_frames).
+    method
+        'percentile': stationary floor, the given low percentile of every
+        frequency bin over time, scaled to the mean power of noise that
+        follows an exponential distribution.
+        'minimum_statistics': time-varying floor, running minimum of the
+        recursively smoothed power over window_frames, times bias. The
+        smoothing starts from the first frame rather than from zero.
+    percentile
+        Percentile used by 'percentile', defaults to 10.
+    alpha
+        Smoothing constant used by 'minimum_statistics', defaults to 0.85.
+    window_frames
+        Length of the minimum search window in frames, defaults to 64
+        (~1.5 s at 22050 Hz and hop 512).
+    bias
+        Compensation for the downward bias of the minimum, defaults to 2.0,
+        which gives the mean power of stationary white noise for the
+        default alpha and window_frames.
+
+    Returns
+    -------
+    np.ndarray
+        Noise power of shape (n_bins, 1) for 'percentile', (n_bins,
+        n_frames) for 'minimum_statistics'.
+
+    See Also
+    --------
+    NoiseFloorTracker
+    """
+    if method == 'percentile':
+        k = int(round(percentile / 100 * (power.shape[1] - 1)))
+        floor = np.partition(power, k, axis=1)[:, k:k + 1]
+        return floor / -np.log(1 - percentile / 100)
+    if method == 'minimum_statistics':
+        smoothed, _ = signal.lfilter([1 - alpha], [1, -alpha], power, axis=1,
+                                     zi=alpha * power[:, :1])
+        return bias * minimum_filter1d(smoothed, window_frames, axis=1,
+                                       origin=(window_frames - 1) // 2,
+                                       mode='nearest')
+    raise ValueError(f'Unknown noise estimation method: {method}')
+
+class NoiseFloorTracker:
+    """
+    Incremental minimum-statistics noise floor estimate for streaming.
+    Feeding consecutive power spectrogram blocks gives the same result as
+    estimate_noise_floor(..., method='minimum_statistics') on the whole
+    spectrogram.
+    Parameters
+    ----------
+    alpha
+        Smoothing constant, defaults to 0.85.
+    window_frames
+        Length of the minimum search window in frames, defaults to 64.
+    bias
+        Compensation for the downward bias of the minimum, defaults to 2.0.
+    """
+    def __init__(self, alpha = 0.85, window_frames = 64, bias = 2.0):
+        self.alpha = alpha
+        self.window_frames = window_frames
+        self.bias = bias
+        self._zi = None
+        self._history = None
+
+    def update(self, power):
+        """
+        Feeds the next block of frames.
+        Parameters
+        ----------
+        power
+            Power spectrogram block, shape (n_bins, n_frames).
+
+        Returns
+        -------
+        np.ndarray
+            Noise power for every frame of the block, same shape as power.
+        """
+        if power.shape[1] == 0:
+            return np.zeros_like(power, dtype=float)
+        if self._zi is None:
+            self._zi = self.alpha * power[:, :1]
+            self._history = np.zeros((power.shape[0], 0))
+        smoothed, self._zi = signal.lfilter([1 - self.alpha], [1, -self.alpha],
+                                            power, axis=1, zi=self._zi)
+        extended = np.concatenate([self._history, smoothed], axis=1)
+        floor = minimum_filter1d(extended, self.window_frames, axis=1,
+                                 origin=(self.window_frames - 1) // 2,
+                                 mode='nearest')[:, -power.shape[1]:]
+        self._history = extended[:, -(self.window_frames - 1):]
+        return self.bias * floor
+
+def estimate_noise_power(noise_sample, y, sr, smoothing = None, n_fft = 2048,
+                         hop_length = 512):
+    """
+    Estimates the noise power spectrum from a noise-only part of a
+    recording.
+    Parameters
+    ----------
+    noise_sample
+        Timing of noise sample, in seconds.
+    y
+        Audio signal, from librosa.load()
+    sr
+        Sampling rate, in Hz.
+    smoothing
+        Smoothing factor along frequency, defaults to None.
+    n_fft
+        FFT window size, defaults to 2048.
+    hop_length
+        Number of samples between frames, defaults to 512.
+
+    Returns
+    -------
+    np.ndarray
+        Mean noise power per frequency bin, shape (1 + n_fft/2,).
+    """
+    noise_start = int(noise_sample[0]*sr)
+    noise_end = int(noise_sample[1]*sr)
+    noise_spectrum = librosa.stft(y[noise_start:noise_end], n_fft=n_fft,
+                                  hop_length=hop_length)
+    noise_power = np.mean(np.abs(noise_spectrum)**2, axis=1)
+
+    if smoothing:
+        noise_power = gaussian_filter(noise_power, sigma=smoothing)
+    return noise_power
+
+def spectral_substraction(noise_sample, y, sr, factor = 1, smoothing = None,
+                          return_audio = False, noise_method = 'percentile'):
     """
     Spectral substraction noise removal function. Takes noise sample and
     removes it from the recording.
     Parameters
     ----------
     noise_sample
-        Timing of noise sample, in seconds.
+        Timing of noise sample, in seconds. If None, the noise floor is
+        estimated automatically from the whole recording.
     y
         Audio signal, from librosa.load()
     sr
@@ -22,6 +162,9 @@ def spectral_substraction(noise_sample, y, sr, factor = 1, smoothing = None, ret
         Smoothing factor, defaults to None.
     return_audio
         Boolean to return audio signal. Defaults to False.
+    noise_method
+        Method of estimate_noise_floor() used if noise_sample is None,
+        defaults to 'percentile'.
 
     Returns
     -------
@@ -33,19 +176,17 @@ def spectral_substraction(noise_sample, y, sr, factor = 1, smoothing = None, ret
 
     """
     y_spectrum = librosa.stft(y)
-    y_spectrum_db = librosa.amplitude_to_db(y_spectrum)
     phase = np.angle(y_spectrum)
-    noise_start = int(noise_sample[0]*sr)
-    noise_end = int(noise_sample[1]*sr)
-    noise_sample = y[noise_start:noise_end]
-    noise_spectrum = librosa.stft(noise_sample)
-    noise_power = np.mean(np.abs(noise_spectrum)**2, axis=1)
+    spectrum_power = np.abs(y_spectrum)**2
 
-    if smoothing:
-        noise_power = gaussian_filter(noise_power, sigma=smoothing)
-    noise_power = noise_power.reshape((-1,1))
+    if noise_sample is None:
+        noise_power = estimate_noise_floor(spectrum_power, method=noise_method)
+        if smoothing:
+            noise_power = gaussian_filter(noise_power, sigma=(smoothing, 0))
+    else:
+        noise_power = estimate_noise_power(noise_sample, y, sr, smoothing)
+        noise_power = noise_power.reshape((-1,1))
 
-    spectrum_power = np.abs(y_spectrum)**2
     spectrum_power_cleaned = spectrum_power - factor * noise_power
     spectrum_power_cleaned = np.maximum(spectrum_power_cleaned, 0)
     spectrum_cleaned_db = librosa.power_to_db(spectrum_power_cleaned)
@@ -57,13 +198,103 @@ def spectral_substraction(noise_sample, y, sr, factor = 1, smoothing = None, ret
 
     return spectrum_cleaned_db
 
+def spectral_substraction_stream(blocks, noise_power = None, factor = 1,
+                                 n_fft = 2048, hop_length = 512):
+    """
+    Streaming spectral substraction. Processes audio block by block with
+    overlap-add at the block boundaries, so memory stays constant
+    regardless of recording length.
+    Parameters
+    ----------
+    blocks
+        Iterable of 1-D audio blocks of any length, e.g. from
+        core.audio_store.stream_audio().
+    noise_power
+        Noise power per frequency bin, from estimate_noise_power(). If
+        None, the noise floor is tracked adaptively with NoiseFloorTracker.
+    factor
+        Amplification factor, defaults to 1.
+    n_fft
+        FFT window size, defaults to 2048.
+    hop_length
+        Number of samples between frames, defaults to 512.
+
+    Returns
+    -------
+    Iterator[np.ndarray]
+        Cleaned audio, chunk by chunk. Concatenated, the chunks match
+        spectral_substraction(..., return_audio=True).
+
+    Notes
+    -----
+    The batch version floors the cleaned spectrum at 80 dB below its global
+    maximum before resynthesis. That floor needs the whole recording and is
+    not applied here, which only affects bins that were cleaned to (near)
+    silence.
+
+    See Also
+    --------
+    streaming.write_stream
+    """
+    tracker = NoiseFloorTracker() if noise_power is None else None
+    if noise_power is not None:
+        noise_power = np.reshape(noise_power, (-1, 1))
+
+    def subtract(spectrum):
+        power = np.abs(spectrum)**2
+        noise = tracker.update(power) if tracker else noise_power
+        cleaned = np.maximum(power - factor * noise, 0)
+        gain = np.sqrt(np.divide(cleaned, power, out=np.zeros_like(power),
+                                 where=power > 0))
+        return spectrum * gain
+
+    stft = StreamingSTFT(subtract, n_fft=n_fft, hop_length=hop_length)
+    for block in blocks:
+        cleaned = stft.process_block(block)
+        if len(cleaned):
+            yield cleaned
+    cleaned = stft.flush()
+    if len(cleaned):
+        yield cleaned
+
+@lru_cache(maxsize=256)
+def design_bandpass(sr, lowcut, highcut, order):
+    """
+    Designs a Butterworth bandpass filter as second-order sections. Designs
+    are cached, so repeated calls with the same arguments are free.
+    Parameters
+    ----------
+    sr
+        Sample rate, in Hz.
+    lowcut
+        lower frequency cutoff, in Hz.
+    highcut
+        upper frequency cutoff, in Hz.
+    order
+        filter order, determines steepness of cutoff.
+
+    Returns
+    -------
+    np.ndarray
+        Second-order sections, shape (n_sections, 6). Shared between
+        callers, do not modify in place.
+    """
+    nyq = 0.5 * sr
+    if not 0 < lowcut < highcut < nyq:
+        raise ValueError(f'Need 0 < lowcut < highcut < {nyq} Hz, got '
+                         f'{lowcut} and {highcut}')
+    sos = signal.butter(order, [lowcut / nyq, highcut / nyq], btype='band',
+                        output='sos')
+    return sos
+
 def apply_bandpass(y, sr, lowcut, highcut, order, return_audio = False):
     """
     Applies simple bandpass filter to audio data.
     Parameters
     ----------
     y
-        Audio signal, from librosa.load()
+        Audio signal, from librosa.load(). A 2-D array of equal-length
+        clips, shape (n_clips, n_samples), is filtered in one call.
     sr
         Sample rate, in Hz.
     lowcut
@@ -82,12 +313,19 @@ def apply_bandpass(y, sr, lowcut, highcut, order, return_audio = False):
     optional:
     np.ndarray
         complex audio data, suitable to recreate audio file.
+
+    Notes
+    -----
+    Filtering is zero-phase (forward and backward) using second-order
+    sections, which stay numerically stable for high orders.
+
+    See Also
+    --------
+    design_bandpass
+    StreamingBandpass
     """
-    nyq = 0.5 * sr
-    low = lowcut / nyq
-    high = highcut / nyq
-    b, a = signal.butter(order, [low, high], btype='band', output = 'ba')
-    y_filtered = signal.filtfilt(b, a, y)
+    sos = design_bandpass(sr, lowcut, highcut, order)
+    y_filtered = signal.sosfiltfilt(sos, y, axis=-1)
 
     if return_audio:
         return y_filtered
@@ -96,6 +334,61 @@ def apply_bandpass(y, sr, lowcut, highcut, order, return_audio = False):
     y_filtered_spectrum_db = librosa.amplitude_to_db(y_filtered_spectrum)
     return y_filtered_spectrum_db
 
+class StreamingBandpass:
+    """
+    Stateful bandpass filter for chunked input. Filter state is carried
+    between chunks, so filtering consecutive chunks gives the same result
+    as filtering the whole signal at once.
+    Parameters
+    ----------
+    sr
+        Sample rate, in Hz.
+    lowcut
+        lower frequency cutoff, in Hz.
+    highcut
+        upper frequency cutoff, in Hz.
+    order
+        filter order, determines steepness of cutoff.
+
+    Notes
+    -----
+    Streaming filtering is causal (forward only), so unlike apply_bandpass
+    it introduces the filter's phase delay. Chunks may be 1-D or 2-D
+    (n_clips, n_samples) to filter several streams at once.
+    """
+    def __init__(self, sr, lowcut, highcut, order):
+        self.sos = design_bandpass(sr, lowcut, highcut, order)
+        self._zi = None
+
+    def process(self, chunk):
+        """
+        Filters the next chunk.
+        Parameters
+        ----------
+        chunk
+            Audio chunk, 1-D or shape (n_clips, n_samples).
+
+        Returns
+        -------
+        np.ndarray
+            Filtered chunk, same shape as chunk.
+        """
+        chunk = np.asarray(chunk)
+        if self._zi is None:
+            zi = signal.sosfilt_zi(self.sos)
+            first = chunk[..., 0]
+            self._zi = zi.reshape((zi.shape[0],) + (1,) * first.ndim + (2,)) \
+                * first[..., None]
+        filtered, self._zi = signal.sosfilt(self.sos, chunk, axis=-1,
+                                            zi=self._zi)
+        return filtered
+
+    def reset(self):
+        """
+        Clears the filter state, to start a new stream.
+        """
+        self._zi = None
+
 def apply_threshold(y, sr, cutoff, return_audio = False):
     """
     Applies simple threshold filter to audio data.
@@ -0,0 +1,280 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+from dataclasses import dataclass, field
+
+import numpy as np
+import librosa
+from scipy.ndimage import gaussian_filter
+
+from .noise_reduction import NoiseFloorTracker, estimate_noise_floor
+from .streaming import StreamingSTFT
+
+
+@dataclass
+class SpectralContext:
+    """
+    Information about the spectrogram passed to pipeline stages.
+
+    Parameters
+    ----------
+    sr: int
+        Sampling rate, in Hz.
+    freqs: np.ndarray
+        Center frequency of each bin, in Hz.
+    times: np.ndarray
+        Time of each frame, in seconds. None when streaming.
+    streaming: bool
+        Whether the stage sees one block of a stream instead of the whole
+        recording.
+    state: dict
+        Per-run storage for stages that carry state between blocks.
+    """
+    sr: int
+    freqs: np.ndarray
+    times: np.ndarray = None
+    streaming: bool = False
+    state: dict = field(default_factory=dict)
+
+
+@dataclass
+class BandpassStage:
+    """
+    Removes all energy outside [lowcut, highcut] by masking frequency bins.
+
+    Parameters
+    ----------
+    lowcut: float
+        Lower frequency cutoff, in Hz.
+    highcut: float
+        Upper frequency cutoff, in Hz.
+    """
+    lowcut: float
+    highcut: float
+
+    def apply(self, power, context):
+        outside = (context.freqs < self.lowcut) | (context.freqs > self.highcut)
+        power[outside] = 0
+
+
+@dataclass
+class SpectralSubstractionStage:
+    """
+    Substracts a noise power spectrum from every frame.
+
+    Parameters
+    ----------
+    noise_sample: tuple
+        Timing of noise sample, in seconds. The noise spectrum is the mean
+        power of the frames in this interval.
+    noise_power: np.ndarray
+        Precomputed noise power per frequency bin, used instead of
+        noise_sample.
+    factor: float
+        Amplification factor, defaults to 1.
+    smoothing: float
+        Smoothing factor along frequency, applied to every noise estimate
+        except noise_power, defaults to None.
+    noise_method: str
+        Method of estimate_noise_floor() used if neither noise_sample nor
+        noise_power is given. When streaming, the noise floor is always
+        tracked with minimum statistics.
+    """
+    noise_sample: tuple = None
+    noise_power: np.ndarray = None
+    factor: float = 1
+    smoothing: float = None
+    noise_method: str = 'percentile'
+
+    def noise(self, power, context):
+        if self.noise_power is not None:
+            noise_power = np.asarray(self.noise_power)
+            return noise_power.reshape((-1, 1)) if noise_power.ndim == 1 else noise_power
+        if context.streaming:
+            tracker = context.state.setdefault(id(self), NoiseFloorTracker())
+            noise_power = tracker.update(power)
+        elif self.noise_sample is not None:
+            frames = ((context.times >= self.noise_sample[0])
+                      & (context.times <= self.noise_sample[1]))
+            noise_power = power[:, frames].mean(axis=1, keepdims=True)
+        else:
+            noise_power = estimate_noise_floor(power, method=self.noise_method)
+        if self.smoothing:
+            # Along frequency only, as in spectral_substraction
+            noise_power = gaussian_filter(noise_power, sigma=(self.smoothing, 0))
+        return noise_power
+
+    def apply(self, power, context):
+        power -= self.factor * self.noise(power, context)
+        np.maximum(power, 0, out=power)
+
+
+@dataclass
+class ThresholdStage:
+    """
+    Sets all bins quieter than cutoff to -80 dB.
+
+    Parameters
+    ----------
+    cutoff: float
+        Cutoff amplitude, in dB.
+
+    Notes
+    -----
+    As in apply_threshold, levels are compared after flooring at 80 dB
+    below the maximum, except when streaming, where the maximum of the
+    recording is unknown. The thresholded bins are recorded in
+    context.state['threshold_mask'], so DenoisePipeline.run() can put them
+    at -80 dB after its own 80 dB floor.
+    """
+    cutoff: float
+
+    def apply(self, power, context):
+        level = power
+        if not context.streaming and power.size:
+            level = np.maximum(power, power.max() * 1e-8)
+        mask = level < 10 ** (self.cutoff / 10)
+        power[mask] = 1e-8
+        if not context.streaming:
+            previous = context.state.get('threshold_mask')
+            context.state['threshold_mask'] = (mask if previous is None
+                                               else previous | mask)
+
+
+class DenoisePipeline:
+    """
+    Chain of spectral-domain denoising stages sharing a single STFT.
+
+    Parameters
+    ----------
+    stages
+        List of stages, applied in order. A stage is any object with an
+        apply(power, context) method modifying the power spectrogram in
+        place, e.g. BandpassStage, SpectralSubstractionStage,
+        ThresholdStage.
+    n_fft
+        FFT window size, defaults to 2048.
+    hop_length
+        Number of samples between frames, defaults to 512.
+
+    Notes
+    -----
+    run() performs one forward and at most one inverse STFT. The complex
+    STFT is normalized in place to unit phasors and a single power array is
+    modified by all stages, so memory is one complex and one real
+    spectrogram regardless of the number of stages.
+
+    See Also
+    --------
+    spectral_substraction
+    apply_bandpass
+    apply_threshold
+    """
+    def __init__(self, stages, n_fft=2048, hop_length=512):
+        self.stages = list(stages)
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+
+    def _apply_stages(self, spectrum, context):
+        power = np.abs(spectrum)
+        np.divide(spectrum, power, out=spectrum, where=power > 0)
+        np.square(power, out=power)
+        for stage in self.stages:
+            stage.apply(power, context)
+        return power
+
+    def run(self, y, sr, return_audio=False):
+        """
+        Applies all stages to an audio signal.
+
+        Parameters
+        ----------
+        y
+            Audio signal, from librosa.load()
+        sr
+            Sampling rate, in Hz.
+        return_audio
+            Boolean to return audio signal. Defaults to False.
+
+        Returns
+        -------
+        np.ndarray
+            spectrum in dB, with all stages applied.
+        optional:
+        np.ndarray
+            denoised audio signal.
+        """
+        spectrum = librosa.stft(y, n_fft=self.n_fft, hop_length=self.hop_length)
+        context = SpectralContext(
+            sr=sr,
+            freqs=librosa.fft_frequencies(sr=sr, n_fft=self.n_fft),
+            times=librosa.frames_to_time(np.arange(spectrum.shape[1]), sr=sr,
+                                         hop_length=self.hop_length))
+        power = self._apply_stages(spectrum, context)
+
+        if return_audio:
+            np.sqrt(power, out=power)
+            spectrum *= power
+            return librosa.istft(spectrum, hop_length=self.hop_length,
+                                 n_fft=self.n_fft)
+
+        np.maximum(power, 1e-10, out=power)
+        np.log10(power, out=power)
+        power *= 10
+        np.maximum(power, power.max() - 80, out=power)
+        mask = context.state.get('threshold_mask')
+        if mask is not None:
+            power[mask] = -80
+        return power
+
+    def stream(self, blocks, sr):
+        """
+        Applies all stages to a stream of audio blocks.
+
+        Parameters
+        ----------
+        blocks
+            Iterable of 1-D audio blocks, e.g. from
+            core.audio_store.stream_audio().
+        sr
+            Sampling rate, in Hz.
+
+        Returns
+        -------
+        Iterator[np.ndarray]
+            Denoised audio, chunk by chunk.
+
+        Notes
+        -----
+        Stages only see one block at a time, so spectral substraction uses
+        either a precomputed noise_power or an adaptive noise floor.
+        """
+        context = SpectralContext(
+            sr=sr, freqs=librosa.fft_frequencies(sr=sr, n_fft=self.n_fft),
+            streaming=True)
+
+        def process(spectrum):
+            power = self._apply_stages(spectrum, context)
+            return spectrum * np.sqrt(power)
+
+        stft = StreamingSTFT(process, n_fft=self.n_fft,
+                             hop_length=self.hop_length)
+        for block in blocks:
+            denoised = stft.process_block(block)
+            if len(denoised):
+                yield denoised
+        denoised = stft.flush()
+        if len(denoised):
+            yield denoised
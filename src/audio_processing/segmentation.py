@@ -0,0 +1,157 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import librosa
+
+
+def activity_curve(power, sr, feature='energy', freq_range=(1000, 10000)):
+    """
+    Computes a per-frame activity measure in dB from a power spectrogram.
+
+    Parameters
+    ----------
+    power
+        Power spectrogram, shape (1 + n_fft/2, n_frames).
+    sr
+        Sampling rate, in Hz.
+    feature
+        'energy': mean power of the frame. 'flux': positive spectral flux,
+        the increase in magnitude compared to the previous frame.
+    freq_range
+        (low, high) band in Hz the measure is computed over, defaults to
+        typical bird call frequencies. None uses all bins.
+
+    Returns
+    -------
+    np.ndarray
+        Activity per frame, in dB.
+    """
+    if freq_range is not None:
+        freqs = librosa.fft_frequencies(sr=sr, n_fft=2 * (power.shape[0] - 1))
+        power = power[(freqs >= freq_range[0]) & (freqs <= freq_range[1])]
+
+    if feature == 'energy':
+        curve = power.mean(axis=0)
+    elif feature == 'flux':
+        magnitude = np.sqrt(power)
+        curve = np.zeros(power.shape[1])
+        curve[1:] = np.maximum(np.diff(magnitude, axis=1), 0).mean(axis=0) ** 2
+    else:
+        raise ValueError(f'Unknown activity feature: {feature}')
+    return 10 * np.log10(np.maximum(curve, 1e-10))
+
+
+def _runs(mask):
+    """
+    Returns start (inclusive) and end (exclusive) indices of True runs.
+    """
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def detect_events(power, sr, hop_length=512, feature='energy', high_db=12,
+                  low_db=6, min_duration=0.1, merge_gap=0.2,
+                  noise_percentile=20, freq_range=(1000, 10000)):
+    """
+    Detects calls in a power spectrogram with hysteresis thresholds on
+    frame energy or spectral flux.
+
+    Parameters
+    ----------
+    power
+        Power spectrogram, shape (1 + n_fft/2, n_frames).
+    sr
+        Sampling rate, in Hz.
+    hop_length
+        Number of samples between frames, defaults to 512.
+    feature
+        Activity measure, 'energy' or 'flux', see activity_curve().
+    high_db
+        An event must exceed the noise level by this much at least once.
+    low_db
+        An event lasts while the activity exceeds the noise level by this
+        much.
+    min_duration
+        Minimum event length in seconds, shorter events are dropped.
+    merge_gap
+        Events separated by less than this many seconds are merged.
+    noise_percentile
+        Percentile of the activity curve used as the noise level.
+    freq_range
+        Band the activity is computed over, see activity_curve().
+
+    Returns
+    -------
+    np.ndarray
+        Event intervals in seconds, shape (n_events, 2) with start and end
+        columns.
+
+    Notes
+    -----
+    Runs in a single vectorized pass over the spectrogram, so it can be
+    used on multi-hour recordings together with memoized spectrograms.
+    """
+    curve = activity_curve(power, sr, feature, freq_range)
+    if curve.size == 0:
+        return np.zeros((0, 2))
+    noise_level = np.percentile(curve, noise_percentile)
+
+    starts, ends = _runs(curve > noise_level + low_db)
+    if len(starts):
+        high_count = np.concatenate([[0], np.cumsum(curve > noise_level + high_db)])
+        keep = high_count[ends] > high_count[starts]
+        starts, ends = starts[keep], ends[keep]
+
+    if len(starts) > 1:
+        gap_frames = merge_gap * sr / hop_length
+        split = np.flatnonzero(starts[1:] - ends[:-1] > gap_frames)
+        starts = starts[np.concatenate([[0], split + 1])]
+        ends = ends[np.concatenate([split, [len(ends) - 1]])]
+
+    keep = (ends - starts) * hop_length / sr >= min_duration
+    intervals = np.stack([starts[keep], ends[keep]], axis=1)
+    return intervals * hop_length / sr
+
+
+def intervals_to_mask(intervals, n_frames, sr, hop_length=512):
+    """
+    Converts event intervals to a boolean mask over frames.
+
+    Parameters
+    ----------
+    intervals
+        Intervals in seconds, shape (n_events, 2).
+    n_frames
+        Number of frames of the spectrogram.
+    sr
+        Sampling rate, in Hz.
+    hop_length
+        Number of samples between frames, defaults to 512.
+
+    Returns
+    -------
+    np.ndarray
+        True for frames whose time lies within an interval.
+    """
+    times = librosa.frames_to_time(np.arange(n_frames), sr=sr,
+                                   hop_length=hop_length)
+    intervals = np.asarray(intervals).reshape(-1, 2)
+    starts = np.searchsorted(times, intervals[:, 0], side='left')
+    ends = np.searchsorted(times, intervals[:, 1], side='left')
+    delta = np.zeros(n_frames + 1, dtype=np.int64)
+    np.add.at(delta, starts, 1)
+    np.add.at(delta, ends, -1)
+    return np.cumsum(delta[:-1]) > 0
@@ -0,0 +1,165 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import librosa
+import soundfile as sf
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class StreamingSTFT:
+    """
+    Block-wise STFT -> spectral processing -> inverse STFT with overlap-add.
+    Audio is fed in blocks of any length and processed audio is returned as
+    soon as no later frame can contribute to it.
+
+    Parameters
+    ----------
+    process
+        Function taking a complex spectrogram block of shape
+        (1 + n_fft/2, n_frames) and returning the processed block.
+    n_fft
+        FFT window size, defaults to 2048.
+    hop_length
+        Number of samples between frames, defaults to 512.
+    window
+        Window function, defaults to 'hann'.
+
+    Notes
+    -----
+    Framing, padding and normalization follow librosa.stft/librosa.istft
+    with center=True, so concatenating all returned blocks gives the same
+    signal as librosa.istft(process(librosa.stft(y))) when process acts on
+    each frame independently. Memory use only depends on the block size.
+    """
+    def __init__(self, process, n_fft=2048, hop_length=512, window='hann'):
+        self.process = process
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.window = librosa.filters.get_window(window, n_fft, fftbins=True)
+        self._window_sq = self.window ** 2
+        self._input = np.zeros(n_fft // 2)
+        self._pending = np.zeros(n_fft - hop_length)
+        self._pending_norm = np.zeros(n_fft - hop_length)
+        self._n_input = 0
+        self._n_frames = 0
+        self._n_emitted = 0
+        self._to_trim = n_fft // 2
+
+    def _run_frames(self, buffer):
+        n_fft, hop = self.n_fft, self.hop_length
+        n_frames = 1 + (len(buffer) - n_fft) // hop if len(buffer) >= n_fft else 0
+        if n_frames == 0:
+            return np.zeros(0), np.zeros(0), buffer
+
+        frames = sliding_window_view(buffer, n_fft)[::hop][:n_frames]
+        spectrum = np.fft.rfft(frames * self.window, axis=1).T
+        spectrum = self.process(spectrum)
+        frames_out = np.fft.irfft(spectrum.T, n=n_fft, axis=1) * self.window
+
+        length = (n_frames - 1) * hop + n_fft
+        signal = np.zeros(length)
+        norm = np.zeros(length)
+        signal[:len(self._pending)] += self._pending
+        norm[:len(self._pending_norm)] += self._pending_norm
+        for i in range(n_frames):
+            signal[i * hop:i * hop + n_fft] += frames_out[i]
+            norm[i * hop:i * hop + n_fft] += self._window_sq
+
+        done = n_frames * hop
+        self._pending = signal[done:]
+        self._pending_norm = norm[done:]
+        self._n_frames += n_frames
+        return signal[:done], norm[:done], buffer[done:]
+
+    def _emit(self, signal, norm):
+        nonzero = norm > np.finfo(norm.dtype).tiny
+        signal[nonzero] /= norm[nonzero]
+        if self._to_trim:
+            trimmed = min(self._to_trim, len(signal))
+            signal = signal[trimmed:]
+            self._to_trim -= trimmed
+        self._n_emitted += len(signal)
+        return signal
+
+    def process_block(self, block):
+        """
+        Feeds a block of audio.
+
+        Parameters
+        ----------
+        block
+            1-D audio signal of any length.
+
+        Returns
+        -------
+        np.ndarray
+            Processed audio that is final, possibly empty.
+        """
+        block = np.asarray(block, dtype=np.float64)
+        self._n_input += len(block)
+        signal, norm, self._input = self._run_frames(
+            np.concatenate([self._input, block]))
+        return self._emit(signal, norm)
+
+    def flush(self):
+        """
+        Processes the remaining input and returns the rest of the output.
+        Call once after the last block.
+
+        Returns
+        -------
+        np.ndarray
+            Remaining processed audio.
+        """
+        n_fft, hop = self.n_fft, self.hop_length
+        signal, norm, _ = self._run_frames(
+            np.concatenate([self._input, np.zeros(n_fft // 2)]))
+        out = self._emit(signal, norm)
+
+        total_frames = 1 + self._n_input // hop
+        expected = hop * (total_frames - 1)
+        remaining = expected - self._n_emitted
+        if remaining <= 0:
+            return out[:len(out) + remaining]
+        tail = self._emit(self._pending[:remaining].copy(),
+                          self._pending_norm[:remaining].copy())
+        return np.concatenate([out, tail])
+
+
+def write_stream(blocks, path, sr):
+    """
+    Writes blocks of audio to a file as they arrive.
+
+    Parameters
+    ----------
+    blocks
+        Iterable of 1-D audio blocks.
+    path
+        Output file, format inferred from the extension.
+    sr
+        Sample rate, in Hz.
+
+    Returns
+    -------
+    int
+        Number of written samples.
+    """
+    n_samples = 0
+    with sf.SoundFile(path, 'w', samplerate=sr, channels=1) as f:
+        for block in blocks:
+            f.write(block)
+            n_samples += len(block)
+    return n_samples
@@ -14,9 +14,40 @@
 #  You should have received a copy of the GNU General Public License
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from functools import lru_cache
 from pathlib import Path
 
+import yaml
+
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
+CONFIG_PATH = PROJECT_ROOT / 'config.yaml'
 DATA_DIR = PROJECT_ROOT / 'data'
-RAW_DATA_DIR = DATA_DIR / 'raw'
\ No newline at end of file
+RAW_DATA_DIR = DATA_DIR / 'raw'
+DECODED_DATA_DIR = DATA_DIR / 'decoded'
+CACHE_DIR = DATA_DIR / 'cache'
+
+
+@lru_cache(maxsize=None)
+def load_config(config_path=CONFIG_PATH):
+    """
+    Load configuration from yaml file. The file is parsed once per process
+    and cached.
+
+    Returns
+    -------
+    dict
+        Configuration dictionary from yaml file
+
+    Raises
+    ------
+    FileNotFoundError
+        If config.yaml is not found
+    yaml.YAMLError
+        If yaml file is malformed
+    """
+    try:
+        with open(config_path, 'r') as file:
+            return yaml.safe_load(file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Config file not found at {config_path}")
@@ -1 +1,4 @@
-from .recording_file import *
\ No newline at end of file
+from .recording_file import *
+from .parallel import *
+from .feature_cache import *
+from .audio_store import *
@@ -0,0 +1,342 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import hashlib
+import math
+import os
+import tempfile
+from pathlib import Path
+
+import librosa
+import numpy as np
+
+from src.config import DECODED_DATA_DIR, RAW_DATA_DIR, load_config
+from .parallel import imap_bounded
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.ogg')
+
+# Context resampled on either side of a streamed block and trimmed again,
+# in seconds. Longer than the impulse response of librosa's resampler.
+RESAMPLE_PAD = 0.1
+
+
+class AudioStore:
+    """
+    Store of decoded audio. Source files are decoded and resampled once
+    and kept as float32 .npy files, which are read back through np.memmap.
+
+    Parameters
+    ----------
+    store_dir
+        Root directory of the store, defaults to DECODED_DATA_DIR.
+    sr
+        Sample rate of the stored audio, defaults to audio.sample_rate
+        from config.yaml.
+
+    Notes
+    -----
+    Decoded files live in <store_dir>/<sr>/<source stem>_<path hash>.npy,
+    see path_for(). A stored file is considered stale once the source file
+    is modified after it. Reading a window of a stored recording only
+    touches the pages of that window.
+
+    See Also
+    --------
+    load_audio
+    """
+    def __init__(self, store_dir=DECODED_DATA_DIR, sr=None):
+        self.sr = sr or load_config()["audio"]["sample_rate"]
+        self.store_dir = Path(store_dir) / str(self.sr)
+
+    def path_for(self, filename):
+        """
+        Returns the path of the decoded version of filename. The name
+        includes a hash of the resolved source path, so files with the same
+        stem in other folders or with other extensions do not collide.
+        """
+        path = Path(filename)
+        digest = hashlib.sha1(str(path.resolve()).encode()).hexdigest()[:12]
+        return self.store_dir / f'{path.stem}_{digest}.npy'
+
+    def has(self, filename):
+        """
+        Checks whether filename has an up-to-date decoded version.
+
+        Parameters
+        ----------
+        filename
+            Path to the source audio file.
+
+        Returns
+        -------
+        bool
+        """
+        try:
+            stored = self.path_for(filename).stat()
+        except FileNotFoundError:
+            return False
+        try:
+            return stored.st_mtime >= Path(filename).stat().st_mtime
+        except FileNotFoundError:
+            return True
+
+    def ingest(self, filename, overwrite=False):
+        """
+        Decodes a source file at the store's sample rate and saves it.
+
+        Parameters
+        ----------
+        filename
+            Path to the source audio file.
+        overwrite
+            If True, decode even if an up-to-date version exists.
+
+        Returns
+        -------
+        Path
+            Path of the decoded file.
+        """
+        target = self.path_for(filename)
+        if not overwrite and self.has(filename):
+            return target
+
+        y, _ = librosa.load(filename, sr=self.sr, dtype=np.float32)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, y)
+            os.replace(tmp_path, target)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        return target
+
+    def _ingest_task(self, filename):
+        try:
+            self.ingest(filename)
+            return filename, None
+        except Exception as e:
+            return filename, f'{type(e).__name__}: {e}'
+
+    def ingest_all(self, folder=RAW_DATA_DIR, n_workers=None):
+        """
+        Decodes every audio file in folder that is not yet in the store.
+
+        Parameters
+        ----------
+        folder
+            Directory with source audio files, defaults to RAW_DATA_DIR.
+        n_workers
+            Number of worker processes, None uses all cores.
+
+        Returns
+        -------
+        dict
+            Mapping of file name to error message for files that failed.
+        """
+        files = [path for path in sorted(Path(folder).iterdir())
+                 if path.suffix.lower() in AUDIO_EXTENSIONS
+                 and not self.has(path)]
+        print(f'Decoding {len(files)} files into {self.store_dir}')
+
+        errors = {}
+        for i, (filename, error) in enumerate(
+                imap_bounded(self._ingest_task, files, n_workers=n_workers,
+                             ordered=False), 1):
+            if error:
+                errors[Path(filename).name] = error
+                print(f'Could not decode {Path(filename).name}: {error}')
+            if i % 100 == 0:
+                print(f'Decoded {i}/{len(files)}')
+        return errors
+
+    def load(self, filename, offset=0.0, duration=None):
+        """
+        Reads decoded audio from the store without copying it to memory.
+
+        Parameters
+        ----------
+        filename
+            Path to the source audio file.
+        offset
+            Start of the window to read, in seconds.
+        duration
+            Length of the window to read in seconds, None reads to the end.
+
+        Returns
+        -------
+        np.ndarray
+            Read-only float32 memory map of the requested samples.
+        """
+        data = np.load(self.path_for(filename), mmap_mode='r')
+        start = int(round(offset * self.sr))
+        stop = None if duration is None else start + int(round(duration * self.sr))
+        return data[start:stop]
+
+    def n_samples(self, filename):
+        """
+        Returns the number of stored samples of filename.
+        """
+        return np.load(self.path_for(filename), mmap_mode='r').shape[0]
+
+
+_default_stores = {}
+
+
+def default_store(sr):
+    """
+    Returns the AudioStore in DECODED_DATA_DIR for a sample rate.
+    """
+    if sr not in _default_stores:
+        _default_stores[sr] = AudioStore(sr=sr)
+    return _default_stores[sr]
+
+
+def audio_duration(filename, sr=None, store=None):
+    """
+    Returns the duration of an audio file without decoding it.
+
+    Parameters
+    ----------
+    filename
+        Path to audio file.
+    sr
+        Sample rate used to look the file up in the store.
+    store
+        AudioStore to consult, defaults to the store in DECODED_DATA_DIR
+        for sr.
+
+    Returns
+    -------
+    float
+        Duration in seconds.
+    """
+    if store is None and sr is not None:
+        store = default_store(sr)
+    if store is not None and store.has(filename):
+        return store.n_samples(filename) / store.sr
+    return librosa.get_duration(path=filename)
+
+
+def load_audio(filename, sr, offset=0.0, duration=None, store=None):
+    """
+    Loads audio, preferring the decoded store over decoding the source
+    file.
+
+    Parameters
+    ----------
+    filename
+        Path to audio file.
+    sr
+        Target sample rate, in Hz.
+    offset
+        Start of the window to load, in seconds.
+    duration
+        Length of the window to load in seconds, None loads to the end.
+    store
+        AudioStore to read from, defaults to the store in DECODED_DATA_DIR
+        for sr.
+
+    Returns
+    -------
+    np.ndarray
+        Audio signal. A read-only memory map if served from the store.
+    int
+        Sample rate, in Hz.
+
+    Notes
+    -----
+    When decoding, only the requested window is decoded and resampled
+    (for formats supported by soundfile), so memory scales with duration
+    rather than with the file length.
+    """
+    if store is None and sr is not None:
+        store = default_store(sr)
+    if store is not None and store.sr == sr and store.has(filename):
+        return store.load(filename, offset, duration), sr
+    return librosa.load(filename, sr=sr, offset=offset, duration=duration)
+
+
+def stream_audio(filename, sr, block_duration=10.0, offset=0.0, duration=None,
+                 store=None):
+    """
+    Reads an audio file block by block.
+
+    Parameters
+    ----------
+    filename
+        Path to audio file.
+    sr
+        Target sample rate, in Hz.
+    block_duration
+        Length of each block, in seconds.
+    offset
+        Start of the streamed range, in seconds.
+    duration
+        Length of the streamed range in seconds, None streams to the end.
+    store
+        AudioStore to read from, see load_audio().
+
+    Returns
+    -------
+    Iterator[np.ndarray]
+        Consecutive audio blocks.
+
+    Notes
+    -----
+    Files that are not in the store are decoded at their native rate in
+    windows overlapping the block by RESAMPLE_PAD on both sides. Each
+    window is resampled and its edges trimmed, so the blocks match
+    load_audio() on the whole file without seams at block boundaries.
+    """
+    if store is None:
+        store = default_store(sr)
+    block_samples = int(round(block_duration * sr))
+    start = int(round(offset * sr))
+
+    if store.sr == sr and store.has(filename):
+        data = store.load(filename)
+        stop = len(data) if duration is None else min(
+            len(data), start + int(round(duration * sr)))
+        for position in range(start, stop, block_samples):
+            yield data[position:min(position + block_samples, stop)]
+        return
+
+    stop = int(round(audio_duration(filename, sr, store) * sr))
+    if duration is not None:
+        stop = min(stop, start + int(round(duration * sr)))
+    native_sr = librosa.get_samplerate(filename)
+    # Windows start on a sample shared by both rates, so every window is
+    # resampled on the same grid as the whole file would be
+    step = sr // math.gcd(sr, native_sr)
+    pad = math.ceil(RESAMPLE_PAD * sr / step) * step if native_sr != sr else 0
+    for position in range(start, stop, block_samples):
+        length = min(block_samples, stop - position)
+        first = max(position - pad, 0) // step * step
+        native_start = first * native_sr // sr
+        native_length = math.ceil((position + length + pad - first)
+                                  * native_sr / sr)
+        # Half a sample more on offset and duration, so float rounding
+        # never drops or repeats samples between windows
+        window, _ = librosa.load(filename, sr=None,
+                                 offset=(native_start + 0.5) / native_sr,
+                                 duration=(native_length + 0.5) / native_sr)
+        if native_sr != sr:
+            window = librosa.resample(window, orig_sr=native_sr, target_sr=sr)
+        block = window[position - first:position - first + length]
+        if len(block) == 0:
+            break
+        yield block
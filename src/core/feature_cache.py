@@ -0,0 +1,250 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from src.config import CACHE_DIR
+
+# Bump whenever feature definitions change, invalidates cached features
+FEATURE_CONFIG_VERSION = 3
+
+
+class FeatureCache:
+    """
+    On-disk cache for computed features, keyed by the identity of the
+    source audio file and the parameters used to compute them.
+
+    Parameters
+    ----------
+    cache_dir
+        Directory to store entries in, defaults to CACHE_DIR/features.
+    max_bytes
+        Size limit of the cache. When exceeded, least recently used entries
+        are evicted. Defaults to 2 GiB.
+    key_mode
+        'stat' identifies files by path, size and modification time,
+        'content' by a SHA-256 of the file content. 'content' survives
+        renames and touches, but reads every file once per process.
+
+    Notes
+    -----
+    Each entry is an .npz file holding a dict of arrays. Entries are
+    written to a temporary file and renamed, so several processes can share
+    a cache directory. Recency is tracked through the modification time of
+    the entry, which is refreshed on every hit.
+
+    See Also
+    --------
+    dataset.creation.load_features
+    Call
+    """
+    def __init__(self, cache_dir=CACHE_DIR / 'features', max_bytes=2 * 1024**3,
+                 key_mode='stat'):
+        if key_mode not in ('stat', 'content'):
+            raise ValueError(f"key_mode must be 'stat' or 'content', got {key_mode}")
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.key_mode = key_mode
+        self.hits = 0
+        self.misses = 0
+        self._content_hashes = {}
+        self._size = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_content_hashes'] = {}
+        return state
+
+    def _file_identity(self, filename):
+        path = Path(filename).resolve()
+        stat = path.stat()
+        if self.key_mode == 'stat':
+            return [str(path), stat.st_size, stat.st_mtime_ns]
+
+        stamp = (str(path), stat.st_size, stat.st_mtime_ns)
+        if stamp not in self._content_hashes:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                while block := f.read(1 << 20):
+                    digest.update(block)
+            self._content_hashes[stamp] = digest.hexdigest()
+        return [self._content_hashes[stamp]]
+
+    def make_key(self, filename, sr, name, version=1, **params):
+        """
+        Builds the cache key of a feature computed from an audio file.
+
+        Parameters
+        ----------
+        filename
+            Path of the source audio file.
+        sr
+            Sample rate the audio was loaded with, in Hz.
+        name
+            Name of the cached feature or feature set.
+        version
+            Version of the feature configuration. Bump it whenever the
+            computation changes to invalidate old entries.
+        params
+            Any further parameters the result depends on.
+
+        Returns
+        -------
+        str
+            Hex digest identifying the entry.
+        """
+        description = json.dumps([self._file_identity(filename), sr, name,
+                                  version, sorted(params.items())],
+                                 default=str)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _entry_path(self, key):
+        return self.cache_dir / key[:2] / f'{key}.npz'
+
+    def get(self, key):
+        """
+        Looks up an entry.
+
+        Parameters
+        ----------
+        key
+            Key from make_key().
+
+        Returns
+        -------
+        dict | None
+            Dict of arrays stored under key, None on a miss.
+        """
+        path = self._entry_path(key)
+        try:
+            with np.load(path) as entry:
+                values = {name: entry[name] for name in entry.files}
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return values
+
+    def put(self, key, values):
+        """
+        Stores an entry, evicting old entries if the size limit is exceeded.
+
+        Parameters
+        ----------
+        key
+            Key from make_key().
+        values
+            Dict of arrays or scalars to store.
+
+        Returns
+        -------
+        None
+        """
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **values)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        if self._size is None:
+            self._size = self._scan_size()
+        else:
+            self._size += path.stat().st_size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        if not self.cache_dir.exists():
+            return []
+        entries = []
+        for path in self.cache_dir.glob('*/*.npz'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, target_bytes=None):
+        """
+        Removes least recently used entries until the cache is below
+        target_bytes.
+
+        Parameters
+        ----------
+        target_bytes
+            Size to shrink to, defaults to 90% of max_bytes.
+
+        Returns
+        -------
+        int
+            Number of removed entries.
+        """
+        if target_bytes is None:
+            target_bytes = int(self.max_bytes * 0.9)
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, entry_size, path in entries:
+            if size <= target_bytes:
+                break
+            path.unlink(missing_ok=True)
+            size -= entry_size
+            removed += 1
+        self._size = size
+        return removed
+
+    def clear(self):
+        """
+        Removes all entries and resets the statistics.
+        """
+        self.evict(target_bytes=0)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+            Hits, misses and hit ratio of this process, plus number of
+            entries and total size of the cache on disk.
+        """
+        entries = self._entries()
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hit_ratio,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries)}
@@ -0,0 +1,107 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+
+
+def chunked(iterable, size):
+    """
+    Splits an iterable into lists of at most size elements, lazily.
+
+    Parameters
+    ----------
+    iterable
+        Any iterable.
+    size
+        Maximum number of elements per chunk.
+
+    Returns
+    -------
+    Iterator[list]
+        Consecutive chunks of the input.
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def imap_bounded(func, tasks, n_workers=None, ordered=True, max_pending=None):
+    """
+    Maps func over tasks in a process pool, yielding results as they
+    become available. Only a bounded number of tasks is submitted at any
+    time, so tasks can be a lazy iterable of any length and memory stays
+    constant.
+
+    Parameters
+    ----------
+    func
+        Picklable, module-level function taking a single task.
+    tasks
+        Iterable of task arguments.
+    n_workers
+        Number of worker processes. None uses all cores, 1 runs everything
+        in the calling process without a pool.
+    ordered
+        If True, results are yielded in task order. If False, results are
+        yielded as soon as they are finished.
+    max_pending
+        Maximum number of submitted but not yet yielded tasks. Defaults to
+        twice the number of workers.
+
+    Returns
+    -------
+    Iterator
+        Results of func.
+
+    Notes
+    -----
+    Exceptions raised by func are re-raised when their result is yielded.
+    Catch errors inside func if a single failing task should not stop the
+    whole run.
+    """
+    if n_workers == 1:
+        for task in tasks:
+            yield func(task)
+        return
+
+    n_workers = n_workers or os.cpu_count()
+    max_pending = max_pending or 2 * n_workers
+    executor = ProcessPoolExecutor(max_workers=n_workers)
+    try:
+        if ordered:
+            pending = deque()
+            for task in tasks:
+                pending.append(executor.submit(func, task))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        else:
+            pending = set()
+            for task in tasks:
+                pending.add(executor.submit(func, task))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
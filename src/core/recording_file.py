@@ -1,14 +1,37 @@
 import librosa
+import librosa.display
 import numpy as np
-import pandas as pd
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import cached_property
 from librosa import feature
 from matplotlib import pyplot as plt
+import os
 import sqlite3
-import yaml
+import threading
 from pathlib import Path
-#TODO: Named Rows and general structural improvements and resilience for errors
-#TODO: Add isolating calls to either dataclass or general package
+
+from src.config import load_config
+from .audio_store import AudioStore, audio_duration, load_audio
+from src.audio_processing.segmentation import detect_events
+from .feature_cache import FEATURE_CONFIG_VERSION, FeatureCache
+
+_connections = threading.local()
+
+
+def _db_connection(database_file):
+    """
+    Returns a connection to database_file, opened once per thread and
+    process and reused by all Call objects.
+    """
+    if getattr(_connections, 'pid', None) != os.getpid():
+        _connections.pid = os.getpid()
+        _connections.cache = {}
+    conn = _connections.cache.get(str(database_file))
+    if conn is None:
+        conn = sqlite3.connect(database_file)
+        conn.row_factory = sqlite3.Row
+        _connections.cache[str(database_file)] = conn
+    return conn
 
 @dataclass
 class Call:
@@ -19,19 +42,36 @@ class Call:
     ----------
     filename: str
         Path to audio file.
+    recording_id: int
+        XenoCanto recording id, parsed from filename if not given.
     samplerate: int
-        Audio sampling rate, defaults to librosa standard 22050.
-    species: str
-        Species name, defaults to Unknown.
-    duration: float
-        Duration in seconds, defaults to 0.
+        Audio sampling rate, defaults to audio.sample_rate from config.yaml.
+    offset: float
+        Start of the analyzed window within the file, in seconds.
+    clip_duration: float
+        Length of the analyzed window in seconds, None (default) analyzes
+        until the end of the file. Only the window is decoded.
+    lazy: bool
+        If True (default), audio, spectrum and database metadata are only
+        loaded on first access. If False, everything is loaded on
+        initialization.
+    feature_cache: FeatureCache
+        Optional cache consulted by feature methods before computing.
+    audio_store: AudioStore
+        Store of decoded audio to read data from. Defaults to the store in
+        DECODED_DATA_DIR, falling back to decoding filename.
+
+    Attributes
+    ----------
     data: np.ndarray
-        Audio data, defaults to None. Loaded from file using librosa.load().
+        Audio data, loaded from file using librosa.load() on first access.
     spectrum: np.ndarray
-        Precomputed spectrum, defaults to None. Calculated upon initialization.
-
+        dB-scaled STFT of data, calculated on first access.
+    metadata: dict
+        Row of the recordings table for this recording, read on first access.
+    species, en_name, country, location, sex, duration
+        Metadata shortcuts, "Unknown" (or 0 for duration) if not in database.
 
-    
     Returns
     -------
     None
@@ -49,60 +89,169 @@ class Call:
     librosa.load()
     """ 
     filename: str
-    recording_id: int
+    recording_id: int = None
     samplerate: int = None
-    species: str = "Unknown"
-    en_name: str = "Unknown"
-    country: str = "Unknown"
-    location: str = "Unknown"
-    sex: str = "Unknown"
-    duration: float = 0
-    data: np.ndarray = None
-    spectrum: np.ndarray = None
+    offset: float = 0.0
+    clip_duration: float = None
+    lazy: bool = True
+    feature_cache: FeatureCache = field(default=None, repr=False)
+    audio_store: AudioStore = field(default=None, repr=False)
 
     def __post_init__(self):
         """
-        Performs post_initialization. Reads data from filename and stores it
-        in self.data, gets species from filename, gets duration in seconds
-        and creates a short term fourier transform.
+        Performs post_initialization. Parses the recording id from the
+        filename and resolves samplerate and database location from config.
+        Audio, spectrum and metadata are loaded here only if lazy is False.
 
         Returns
         -------
 
         """
         config = self.load_config()
-        try:
-            self.recording_id = int(self.filename[:5])
-        except ValueError:
-            print("Invalid recording ID/filename format")
-            return None
+        if self.recording_id is None:
+            try:
+                self.recording_id = int(Path(self.filename).name.split('_')[0])
+            except ValueError:
+                print("Invalid recording ID/filename format")
 
-        self.samplerate = config["audio"]["samplerate"]
+        if self.samplerate is None:
+            self.samplerate = config["audio"]["sample_rate"]
 
         root_dir = Path(__file__).parents[2]
-        self.database_file = root_dir / config["database"]["filename"]
+        self.database_file = root_dir / config["database"]["path"]
 
         if not Path(self.filename).exists():
             raise FileNotFoundError(f"Audio file not found: {self.filename}")
-        self.data, self.samplerate = librosa.load(self.filename,
-                                               sr=self.samplerate)
 
-        self.spectrum = librosa.amplitude_to_db(librosa.stft(self.data))
+        self._data = None
+        self._data_modified = False
+        self._spectrograms = {}
+
+        if not self.lazy:
+            self.data
+            self.spectrum
+            self.metadata
+
+    @property
+    def data(self) -> np.ndarray:
+        """
+        Audio data, loaded on first access. Read as a memory map if the
+        file was ingested into the audio store, decoded from filename
+        otherwise.
+        """
+        if self._data is None:
+            self._data, self.samplerate = load_audio(
+                self.filename, self.samplerate, offset=self.offset,
+                duration=self.clip_duration, store=self.audio_store)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._data_modified = True
+        self.invalidate_spectral_cache()
+
+    @cached_property
+    def spectrum(self) -> np.ndarray:
+        """
+        dB-scaled STFT of the audio data, computed on first access.
+        """
+        return librosa.amplitude_to_db(self.magnitude_spectrogram())
+
+    def magnitude_spectrogram(self, n_fft=2048, hop_length=512,
+                              window='hann') -> np.ndarray:
+        """
+        Returns the magnitude STFT of the audio data. Results are memoized
+        per (n_fft, hop_length, window), so all features using the same
+        parameters share a single STFT.
+
+        Parameters
+        ----------
+        n_fft
+            FFT window size, defaults to 2048.
+        hop_length
+            Number of samples between frames, defaults to 512.
+        window
+            Window function passed to librosa.stft, defaults to 'hann'.
+
+        Returns
+        -------
+        np.ndarray
+            Magnitude spectrogram of shape (1 + n_fft/2, n_frames).
 
-        database_result = self._get_from_db()
+        See Also
+        --------
+        power_spectrogram
+        invalidate_spectral_cache
+        """
+        key = (n_fft, hop_length, window, 1)
+        if key not in self._spectrograms:
+            self._spectrograms[key] = np.abs(
+                librosa.stft(self.data, n_fft=n_fft, hop_length=hop_length,
+                             window=window))
+        return self._spectrograms[key]
+
+    def power_spectrogram(self, n_fft=2048, hop_length=512,
+                          window='hann') -> np.ndarray:
+        """
+        Returns the power STFT of the audio data, memoized like
+        magnitude_spectrogram().
 
-        if database_result:
-            self.species = database_result[2]
-            self.en_name = database_result[5]
-            self.country = database_result[6]
-            self.location = database_result[7]
-            self.sex = database_result[11]
-            self.duration = float(database_result[15])
-            #FIXME: This sucks, use named columns
+        See Also
+        --------
+        magnitude_spectrogram
+        """
+        key = (n_fft, hop_length, window, 2)
+        if key not in self._spectrograms:
+            self._spectrograms[key] = self.magnitude_spectrogram(
+                n_fft, hop_length, window) ** 2
+        return self._spectrograms[key]
+
+    def invalidate_spectral_cache(self):
+        """
+        Drops all memoized spectrograms and the dB spectrum. Called
+        automatically when data is reassigned, call it manually after
+        modifying data in place.
+        """
+        self._spectrograms.clear()
+        self.__dict__.pop('spectrum', None)
+
+    @cached_property
+    def metadata(self) -> dict:
+        """
+        Database row of this recording as a dict of column name to value,
+        empty if the recording is not in the database.
+        """
+        return self._get_from_db() or {}
+
+    @property
+    def species(self) -> str:
+        return self.metadata.get("specific_species") or "Unknown"
+
+    @property
+    def en_name(self) -> str:
+        return self.metadata.get("en_name") or "Unknown"
+
+    @property
+    def country(self) -> str:
+        return self.metadata.get("country") or "Unknown"
+
+    @property
+    def location(self) -> str:
+        return self.metadata.get("location") or "Unknown"
+
+    @property
+    def sex(self) -> str:
+        return self.metadata.get("sex") or "Unknown"
+
+    @property
+    def duration(self) -> float:
+        return float(self.metadata.get("length") or 0)
 
     def load_config(self):
         """
-        Load configuration from yaml file.
+        Load configuration from yaml file. The file is read once per
+        process and cached.
 
         Returns
         -------
@@ -116,20 +265,95 @@ class Call:
         yaml.YAMLError
             If yaml file is malformed
         """
-        config_path = Path(__file__).parents[2] / 'config.yaml'
-        try:
-            with open(config_path, 'r') as file:
-                return yaml.safe_load(file)
-        except FileNotFoundError:
-            raise FileNotFoundError(f"Config file not found at {config_path}")
+        return load_config()
+
+    def segments(self, **kwargs):
+        """
+        Detects calls in the recording.
+
+        Parameters
+        ----------
+        kwargs
+            Passed to audio_processing.segmentation.detect_events(), e.g.
+            feature, high_db, low_db, min_duration, merge_gap.
+
+        Returns
+        -------
+        np.ndarray
+            Call intervals in seconds from the start of the file, shape
+            (n_calls, 2).
+
+        See Also
+        --------
+        audio_processing.segmentation.detect_events
+        """
+        intervals = detect_events(self.power_spectrogram(), self.samplerate,
+                                  hop_length=512, **kwargs)
+        return intervals + self.offset
+
+    def windows(self, window, hop=None):
+        """
+        Splits the recording into consecutive or overlapping windows.
+
+        Parameters
+        ----------
+        window
+            Window length, in seconds.
+        hop
+            Distance between window starts in seconds, defaults to window
+            (no overlap).
+
+        Returns
+        -------
+        Iterator[Call]
+            Lazy Call objects covering one window each. Only the audio of
+            windows that are accessed is loaded.
+
+        See Also
+        --------
+        iter_windows
+        """
+        start = self.offset
+        end = audio_duration(self.filename, self.samplerate, self.audio_store)
+        if self.clip_duration is not None:
+            end = min(end, self.offset + self.clip_duration)
+        for call in iter_windows(self.filename, window, hop, start=start,
+                                 end=end, samplerate=self.samplerate,
+                                 recording_id=self.recording_id,
+                                 feature_cache=self.feature_cache,
+                                 audio_store=self.audio_store):
+            if 'metadata' in self.__dict__:
+                call.metadata = self.metadata
+            yield call
+
+    def _cached_feature(self, name, compute, **params):
+        """
+        Returns a feature from feature_cache if available, otherwise
+        computes it and stores it. The cache is bypassed once data has
+        been reassigned, as the key only describes the file on disk.
+        """
+        if self.feature_cache is None or self._data_modified:
+            return compute()
+        key = self.feature_cache.make_key(self.filename, self.samplerate,
+                                          f'call.{name}',
+                                          version=FEATURE_CONFIG_VERSION,
+                                          offset=self.offset,
+                                          clip_duration=self.clip_duration,
+                                          **params)
+        cached = self.feature_cache.get(key)
+        if cached is not None:
+            return cached['value']
+        value = compute()
+        self.feature_cache.put(key, {'value': value})
+        return value
 
     def _get_from_db(self):
         try:
-            with sqlite3.connect(self.database_file) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM recordings where recording_id = ?",
-                               (self.recording_id,))
-                return cursor.fetchone()
+            cursor = _db_connection(self.database_file).cursor()
+            cursor.execute("SELECT * FROM recordings where recording_id = ?",
+                           (self.recording_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
         except sqlite3.Error as e:
             print(f"Database error: {e}")
             return None
@@ -204,8 +428,9 @@ class Call:
         --------
         
         """ 
-        centroid = librosa.feature.spectral_centroid(y=self.data,
-                                                     sr=self.samplerate)[0]
+        centroid = self._cached_feature(
+            'centroid', lambda: librosa.feature.spectral_centroid(
+                S=self.magnitude_spectrogram(), sr=self.samplerate)[0])
         return centroid
 
     def show_spectrum(self):
@@ -254,22 +479,41 @@ class Call:
         -----
         Listed features: MFCCs, Spectral Centroid, Bandwith, Rolloff, Zero Crossing Rate, RMS Energy.
 
+        All spectral features are computed from the memoized spectrograms,
+        so the signal is transformed once per STFT configuration. RMS is
+        derived from the magnitude spectrogram rather than time-domain
+        frames, corrected for the energy of the Hann window.
+
         See Also
         --------
         centroid
         show_spectrum
         """
-        mfccs = librosa.feature.mfcc(y=self.data, sr=self.samplerate, n_mfcc=8,
-                                     n_fft=512,
-                                     hop_length=512, fmin= 4000, fmax = 8000)
-        centroid = librosa.feature.spectral_centroid(y=self.data,
-                                                     sr=self.samplerate)[0]
-        bandwidth = librosa.feature.spectral_bandwidth(y=self.data,
-                                                       sr=self.samplerate)[0]
-        rolloff = librosa.feature.spectral_rolloff(y=self.data,
-                                                   sr=self.samplerate)[0]
-        zcr = librosa.feature.zero_crossing_rate(self.data)[0]
-        rms = librosa.feature.rms(y=self.data)[0]
+        def mfcc():
+            mel = librosa.feature.melspectrogram(
+                S=self.power_spectrogram(n_fft=512, hop_length=512),
+                sr=self.samplerate, n_fft=512, fmin=4000, fmax=8000)
+            return librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=8)
+
+        mfccs = self._cached_feature('mfcc', mfcc)
+        centroid = self.centroid()
+        bandwidth = self._cached_feature(
+            'bandwidth', lambda: librosa.feature.spectral_bandwidth(
+                S=self.magnitude_spectrogram(), sr=self.samplerate)[0])
+        rolloff = self._cached_feature(
+            'rolloff', lambda: librosa.feature.spectral_rolloff(
+                S=self.magnitude_spectrogram(), sr=self.samplerate)[0])
+        zcr = self._cached_feature(
+            'zcr', lambda: librosa.feature.zero_crossing_rate(self.data)[0])
+        def rms():
+            # Rescaled by the Hann window energy to match the time-domain
+            # RMS, as in dataset.features
+            window_gain = np.sqrt(np.mean(
+                librosa.filters.get_window('hann', 2048) ** 2))
+            return librosa.feature.rms(S=self.magnitude_spectrogram(),
+                                       frame_length=2048)[0] / window_gain
+
+        rms = self._cached_feature('rms', rms)
 
         fig, ax = plt.subplots(6, 1, figsize=(15, 6*4))
 
@@ -297,9 +541,114 @@ class Call:
         return fig
 
 
+def iter_windows(filename, window, hop=None, start=0.0, end=None,
+                 **call_kwargs):
+    """
+    Yields windows of a long recording as lazy Call objects.
 
+    Parameters
+    ----------
+    filename
+        Path to audio file.
+    window
+        Window length, in seconds.
+    hop
+        Distance between window starts in seconds, defaults to window.
+    start
+        Start of the first window, in seconds.
+    end
+        End of the covered range in seconds, defaults to the file duration.
+    call_kwargs
+        Further arguments passed to Call.
 
+    Returns
+    -------
+    Iterator[Call]
+        One Call per window. The last window is shorter if the range does
+        not divide evenly.
+    """
+    hop = hop or window
+    if end is None:
+        end = audio_duration(filename, call_kwargs.get('samplerate'),
+                             call_kwargs.get('audio_store'))
+    offset = start
+    while offset < end:
+        yield Call(filename, offset=offset,
+                   clip_duration=min(window, end - offset), **call_kwargs)
+        if offset + window >= end:
+            break
+        offset += hop
+
+
+def prefetch_metadata(calls, columns=None, chunk_size=900):
+    """
+    Loads the metadata of many Call objects with one query per database
+    and chunk instead of one query per Call.
 
+    Parameters
+    ----------
+    calls
+        Iterable of Call objects. Their metadata is set in place.
+    columns
+        Columns of the recordings table to fetch, all if None.
+    chunk_size
+        Maximum number of ids per query, below sqlite's limit of 999 bound
+        parameters.
 
+    Returns
+    -------
+    list
+        The Call objects.
+    """
+    calls = list(calls)
+    by_database = {}
+    for call in calls:
+        by_database.setdefault(str(call.database_file), []).append(call)
+
+    selected = '*'
+    if columns is not None:
+        selected = ', '.join(dict.fromkeys(['recording_id', *columns]))
+
+    for database_file, group in by_database.items():
+        ids = list({call.recording_id for call in group
+                    if call.recording_id is not None})
+        rows = {}
+        try:
+            cursor = _db_connection(database_file).cursor()
+            for i in range(0, len(ids), chunk_size):
+                chunk = ids[i:i + chunk_size]
+                placeholders = ','.join(['?'] * len(chunk))
+                cursor.execute(f"SELECT {selected} FROM recordings "
+                               f"WHERE recording_id IN ({placeholders})", chunk)
+                rows.update((row['recording_id'], row)
+                            for row in cursor.fetchall())
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            continue
+        for call in group:
+            row = rows.get(call.recording_id)
+            call.__dict__['metadata'] = dict(row) if row else {}
+    return calls
+
+
+def load_calls(filenames, columns=None, **call_kwargs):
+    """
+    Creates lazy Call objects for many files and prefetches their metadata
+    in bulk, see prefetch_metadata().
 
+    Parameters
+    ----------
+    filenames
+        Paths to audio files.
+    columns
+        Metadata columns to fetch, all if None.
+    call_kwargs
+        Further arguments passed to Call.
 
+    Returns
+    -------
+    list
+        One Call per filename.
+    """
+    calls = [Call(filename, **call_kwargs) for filename in filenames]
+    return prefetch_metadata(calls, columns)
@@ -15,3 +15,5 @@
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from .xeno_canto_api import XenoCantoAPI, XenoCantoRecording
+from .downloader import Downloader, DownloadResult, TokenBucket
+from .response_cache import ResponseCache
@@ -0,0 +1,421 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.config import RAW_DATA_DIR
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Parameters
+    ----------
+    rate
+        Tokens added per second, i.e. the sustained request rate.
+    capacity
+        Maximum number of tokens, i.e. the allowed burst size.
+    """
+    def __init__(self, rate=1.0, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until tokens are available and takes them.
+
+        Parameters
+        ----------
+        tokens
+            Number of tokens to take, defaults to 1.
+
+        Returns
+        -------
+        float
+            Seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens
+                                   + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def make_session(pool_size=10, retries=3, backoff_factor=1.0):
+    """
+    Creates a requests.Session with a connection pool of pool_size.
+    Failed connections, 429 and 5xx responses are retried up to retries
+    times with exponential backoff, honouring Retry-After headers.
+    """
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=backoff_factor,
+                  status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=('GET', 'HEAD'), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def part_path_for(path):
+    """
+    Returns the path partial data of path is written to.
+    """
+    path = Path(path)
+    return path.with_name(path.name + '.part')
+
+
+def stream_to_file(response, path, chunk_size=1 << 16, append=False,
+                   expected_size=None):
+    """
+    Writes a streamed response to path in chunks. Data is written to
+    path.part first and renamed once complete, so path never holds a
+    partial file. If the transfer fails, path.part is kept so the download
+    can be resumed.
+
+    Parameters
+    ----------
+    response
+        requests.Response opened with stream=True.
+    path
+        Target file.
+    chunk_size
+        Bytes per chunk, defaults to 64 KiB.
+    append
+        If True, the response continues the data already in path.part.
+    expected_size
+        Total size of the file in bytes. If given, path is only created
+        when path.part has exactly this size.
+
+    Returns
+    -------
+    int
+        Number of bytes written.
+    """
+    path = Path(path)
+    part_path = part_path_for(path)
+    written = 0
+    with open(part_path, 'ab' if append else 'wb') as f:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            f.write(chunk)
+            written += len(chunk)
+    if expected_size is not None:
+        size = part_path.stat().st_size
+        if size != expected_size:
+            raise OSError(f'Incomplete download of {path.name}: '
+                          f'{size} of {expected_size} bytes')
+    os.replace(part_path, path)
+    return written
+
+
+@dataclass
+class DownloadResult:
+    """
+    Outcome of downloading one recording.
+
+    Parameters
+    ----------
+    recording_id: int
+        XenoCanto recording id.
+    path: Path
+        Location of the downloaded file.
+    bytes: int
+        Number of bytes transferred.
+    seconds: float
+        Time spent on the transfer.
+    error: str
+        Error message if the download failed, else None.
+    size: int
+        Size of the file on disk, complete or partial.
+    etag: str
+        ETag reported by the server, if any.
+    skipped: bool
+        True if the file was already complete and nothing was transferred.
+    resumed_from: int
+        Offset the download was resumed at, 0 for a full download.
+    """
+    recording_id: int
+    path: Path
+    bytes: int = 0
+    seconds: float = 0.0
+    error: str = None
+    size: int = None
+    etag: str = None
+    skipped: bool = False
+    resumed_from: int = 0
+
+    @property
+    def completed(self):
+        return self.error is None
+
+    def state(self):
+        """
+        Returns the download state row stored by
+        DatabaseHandler.update_download_states().
+        """
+        return {'recording_id': self.recording_id,
+                'filename': self.path.name,
+                'size': self.size,
+                'etag': self.etag,
+                'completed': self.completed}
+
+
+def _total_size(response, offset):
+    """
+    Returns the total file size from a (partial) response, None if unknown.
+    """
+    content_range = response.headers.get('Content-Range', '')
+    if '/' in content_range and not content_range.endswith('*'):
+        return int(content_range.rsplit('/', 1)[1])
+    length = response.headers.get('Content-Length')
+    if length is None:
+        return None
+    return int(length) + (offset if response.status_code == 206 else 0)
+
+
+class Downloader:
+    """
+    Concurrent, rate-limited downloader for XenoCantoRecording objects.
+
+    Parameters
+    ----------
+    folder
+        Directory to save recordings to, defaults to RAW_DATA_DIR.
+    max_workers
+        Number of concurrent downloads, defaults to 4.
+    rate
+        Maximum number of new requests per second, defaults to 1.
+    burst
+        Number of requests that may be started at once, defaults to 1.
+    chunk_size
+        Bytes written per chunk, defaults to 64 KiB.
+    session
+        requests.Session to use, a pooled session is created by default.
+    timeout
+        Connect/read timeout per request, in seconds.
+
+    Notes
+    -----
+    The rate limit applies to starting requests, so slow transfers overlap
+    while the request rate stays within the service's limits. Files are
+    streamed to disk and renamed atomically once complete.
+
+    Downloads are idempotent: files already on disk with their expected
+    size are skipped and partial downloads (.part files) are resumed with
+    HTTP Range requests. With a DatabaseHandler, the expected size and ETag
+    of each file are kept in its downloads table, so complete files are
+    skipped without any request.
+
+    See Also
+    --------
+    TokenBucket
+    XenoCantoAPI.download_recordings
+    """
+    def __init__(self, folder=RAW_DATA_DIR, max_workers=4, rate=1.0, burst=1,
+                 chunk_size=1 << 16, session=None, timeout=30):
+        self.folder = Path(folder)
+        self.max_workers = max_workers
+        self.rate_limiter = TokenBucket(rate, burst)
+        self.chunk_size = chunk_size
+        self.session = session or make_session(max_workers)
+        self.timeout = timeout
+
+    def _is_complete(self, recording, path, state):
+        """
+        Checks whether path already holds the complete recording. Without a
+        stored state, the size is compared to the server's Content-Length.
+        Returns (complete, etag), complete is None if the server does not
+        report a length.
+        """
+        if not path.exists():
+            return False, None
+        size = path.stat().st_size
+        if state and state.get('completed') and state.get('size') is not None:
+            return state['size'] == size, state.get('etag')
+
+        self.rate_limiter.acquire()
+        response = self.session.head(recording.file_url, allow_redirects=True,
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        length = response.headers.get('Content-Length')
+        if length is None:
+            # Size unknown, e.g. chunked response, verify with a Range request
+            return None, response.headers.get('ETag')
+        return int(length) == size, response.headers.get('ETag')
+
+    def download(self, recording, state=None):
+        """
+        Downloads one recording, skipping it if already complete and
+        resuming it if partially downloaded.
+
+        Parameters
+        ----------
+        recording
+            XenoCantoRecording to download.
+        state
+            Stored download state of the recording, a dict with size, etag
+            and completed keys as returned by
+            DatabaseHandler.get_download_states().
+
+        Returns
+        -------
+        DownloadResult
+        """
+        recording.filename = recording.build_filename()
+        path = self.folder / recording.filename
+        part_path = part_path_for(path)
+        start = time.perf_counter()
+        offset = 0
+        etag = state.get('etag') if state else None
+        try:
+            complete, fresh_etag = self._is_complete(recording, path, state)
+            etag = fresh_etag or etag
+            if complete:
+                return DownloadResult(recording.recording_id, path,
+                                      size=path.stat().st_size, etag=etag,
+                                      skipped=True)
+            if complete is None and not part_path.exists():
+                # Unverified file, resume from its end like a partial one
+                os.replace(path, part_path)
+
+            headers = {}
+            if part_path.exists():
+                offset = part_path.stat().st_size
+                headers['Range'] = f'bytes={offset}-'
+                if etag:
+                    headers['If-Range'] = etag
+
+            self.rate_limiter.acquire()
+            response = self.session.get(recording.file_url, stream=True,
+                                        headers=headers, timeout=self.timeout)
+            if response.status_code == 416:
+                response.close()
+                if (response.headers.get('Content-Range')
+                        == f'bytes */{offset}'):
+                    # .part already holds the whole file
+                    os.replace(part_path, path)
+                    return DownloadResult(recording.recording_id, path,
+                                          seconds=time.perf_counter() - start,
+                                          size=offset, etag=etag, skipped=True,
+                                          resumed_from=offset)
+                # .part is not a prefix of the current file, start over
+                part_path.unlink()
+                offset = 0
+                self.rate_limiter.acquire()
+                response = self.session.get(recording.file_url, stream=True,
+                                            timeout=self.timeout)
+            with response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    offset = 0
+                etag = response.headers.get('ETag', etag)
+                size = _total_size(response, offset)
+                written = stream_to_file(response, path, self.chunk_size,
+                                         append=offset > 0,
+                                         expected_size=size)
+        except (requests.RequestException, OSError) as e:
+            size = part_path.stat().st_size if part_path.exists() else None
+            return DownloadResult(recording.recording_id, path,
+                                  seconds=time.perf_counter() - start,
+                                  error=f'{type(e).__name__}: {e}',
+                                  size=size, etag=etag, resumed_from=offset)
+        return DownloadResult(recording.recording_id, path, written,
+                              time.perf_counter() - start,
+                              size=path.stat().st_size, etag=etag,
+                              resumed_from=offset)
+
+    def download_all(self, recordings, database=None, commit_every=20):
+        """
+        Downloads recordings concurrently, yielding results as downloads
+        finish.
+
+        Parameters
+        ----------
+        recordings
+            List of XenoCantoRecording objects.
+        database
+            DatabaseHandler to read and record download state with. State
+            is only written from the calling thread.
+        commit_every
+            Number of results after which download state is written.
+
+        Returns
+        -------
+        Iterator[DownloadResult]
+        """
+        self.folder.mkdir(parents=True, exist_ok=True)
+        states = {}
+        if database is not None:
+            states = database.get_download_states(
+                [recording.recording_id for recording in recordings])
+
+        start = time.perf_counter()
+        total_bytes = 0
+        failed = skipped = 0
+        pending = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(self.download, recording,
+                                           states.get(recording.recording_id))
+                           for recording in recordings]
+                for i, future in enumerate(as_completed(futures), 1):
+                    result = future.result()
+                    total_bytes += result.bytes
+                    if result.error:
+                        failed += 1
+                        print(f'Failed to download {result.recording_id}: '
+                              f'{result.error}')
+                    elif result.skipped:
+                        skipped += 1
+                    else:
+                        print(f'Downloaded recording {i}/{len(futures)}')
+
+                    if database is not None:
+                        pending.append(result.state())
+                        if len(pending) >= commit_every:
+                            database.update_download_states(pending)
+                            pending = []
+                    yield result
+        finally:
+            if pending:
+                database.update_download_states(pending)
+
+        elapsed = time.perf_counter() - start
+        rate = total_bytes / elapsed if elapsed else 0.0
+        print(f'Downloaded {total_bytes / 1e6:.1f} MB in {elapsed:.1f} s '
+              f'({rate / 1e6:.2f} MB/s), {skipped} already present, '
+              f'{failed} failed.')
@@ -0,0 +1,184 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Harvests recording metadata for many queries straight into the database,
+without downloading audio.
+
+Usage::
+
+    python -m src.data_acquisition.harvest "Turdus merula cnt:Germany" \
+        "Parus major" --workers 4
+    python -m src.data_acquisition.harvest --file checklist.txt --cache
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+
+from src.config import PROJECT_ROOT, load_config
+from src.database import DatabaseHandler
+from .response_cache import ResponseCache
+from .xeno_canto_api import XenoCantoAPI, XenoCantoError
+
+
+@dataclass
+class HarvestStats:
+    """
+    Summary of a harvest.
+
+    Parameters
+    ----------
+    pages: int
+        Number of fetched pages.
+    recordings: int
+        Number of parsed recordings.
+    inserted: int
+        Number of rows newly inserted into the database.
+    seconds: float
+        Wall time of the harvest.
+    errors: dict
+        Error message per failed (query, page).
+    """
+    pages: int = 0
+    recordings: int = 0
+    inserted: int = 0
+    seconds: float = 0.0
+    errors: dict = field(default_factory=dict)
+
+
+def _fetch(api, query, page):
+    data = api.fetch_page(query, page)
+    return data, api.parse_page(data)
+
+
+def harvest(queries, database, api=None, max_workers=4, batch_size=1000):
+    """
+    Fetches all pages of several queries concurrently and inserts the
+    recordings into the database in batched transactions.
+
+    Parameters
+    ----------
+    queries
+        Search queries, e.g. 'Turdus merula cnt:Germany'.
+    database
+        DatabaseHandler to insert recordings into.
+    api
+        XenoCantoAPI to search with. Its rate limit is shared by all
+        workers. Defaults to a new XenoCantoAPI.
+    max_workers
+        Number of concurrent page requests.
+    batch_size
+        Number of rows inserted per transaction.
+
+    Returns
+    -------
+    HarvestStats
+
+    Notes
+    -----
+    Page 1 of every query is requested first to learn the number of pages,
+    the remaining pages are queued as soon as it arrives. Parsing happens
+    in the workers, database writes only in the calling thread.
+    """
+    api = api or XenoCantoAPI()
+    stats = HarvestStats()
+    batch = []
+    start = time.perf_counter()
+
+    def flush():
+        stats.inserted += database.upload_recordings(batch, batch_size)
+        batch.clear()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(_fetch, api, query, 1): (query, 1)
+                   for query in queries}
+        total_pages = len(pending)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                query, page = pending.pop(future)
+                try:
+                    data, recordings = future.result()
+                except XenoCantoError as e:
+                    stats.errors[(query, page)] = str(e)
+                    print(f'Failed to fetch page {page} of "{query}": {e}')
+                    continue
+
+                if page == 1:
+                    n_pages = int(data['numPages'])
+                    total_pages += n_pages - 1
+                    for next_page in range(2, n_pages + 1):
+                        future = executor.submit(_fetch, api, query, next_page)
+                        pending[future] = (query, next_page)
+
+                stats.pages += 1
+                stats.recordings += len(recordings)
+                batch.extend(recordings)
+                if len(batch) >= batch_size:
+                    flush()
+                print(f'Fetched page {stats.pages}/{total_pages}, '
+                      f'{stats.recordings} recordings.')
+    flush()
+
+    stats.seconds = time.perf_counter() - start
+    rate = stats.recordings / stats.seconds if stats.seconds else 0.0
+    print(f'Harvested {stats.recordings} recordings ({stats.inserted} new) '
+          f'from {stats.pages} pages in {stats.seconds:.1f} s '
+          f'({rate:.0f} rows/s), {len(stats.errors)} pages failed.')
+    return stats
+
+
+def main(argv=None):
+    config = load_config()
+    parser = argparse.ArgumentParser(
+        description='Harvest Xeno-canto metadata into the recordings database.')
+    parser.add_argument('queries', nargs='*',
+                        help='Search queries, e.g. "Turdus merula cnt:Germany".')
+    parser.add_argument('--file', help='File with one query per line.')
+    parser.add_argument('--database',
+                        default=PROJECT_ROOT / config['database']['path'],
+                        help='SQLite database to insert into.')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of concurrent page requests.')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='Maximum requests per second.')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Rows inserted per transaction.')
+    parser.add_argument('--cache', action='store_true',
+                        help='Serve repeated queries from the response cache.')
+    parser.add_argument('--offline', action='store_true',
+                        help='Only use cached responses.')
+    args = parser.parse_args(argv)
+
+    queries = list(args.queries)
+    if args.file:
+        with open(args.file) as f:
+            queries += [line.strip() for line in f
+                        if line.strip() and not line.startswith('#')]
+    if not queries:
+        parser.error('no queries given')
+
+    cache = None
+    if args.cache or args.offline:
+        cache = ResponseCache(offline=args.offline)
+    api = XenoCantoAPI(rate=args.rate, cache=cache)
+    stats = harvest(queries, DatabaseHandler(args.database), api,
+                    max_workers=args.workers, batch_size=args.batch_size)
+    return 1 if stats.errors else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
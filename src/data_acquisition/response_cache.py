@@ -0,0 +1,187 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from src.config import DATA_DIR
+
+
+def normalize_query(query):
+    """
+    Normalizes a search query so equivalent queries share a cache entry:
+    lower case, single spaces and key:value filters in sorted order.
+    """
+    terms = query.lower().split()
+    if '"' in query:
+        return ' '.join(terms)
+    words = [term for term in terms if ':' not in term]
+    filters = sorted(term for term in terms if ':' in term)
+    return ' '.join(words + filters)
+
+
+@dataclass
+class CachedResponse:
+    """
+    Response body stored in a ResponseCache.
+
+    Parameters
+    ----------
+    body: str
+        Response body.
+    etag: str
+        ETag header of the response, if any.
+    last_modified: str
+        Last-Modified header of the response, if any.
+    fetched: float
+        Time the response was last fetched or revalidated, as a unix
+        timestamp.
+    """
+    body: str
+    etag: str = None
+    last_modified: str = None
+    fetched: float = 0.0
+
+    def age(self):
+        return time.time() - self.fetched
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache of API responses, keyed by endpoint, normalized
+    query and page.
+
+    Parameters
+    ----------
+    path
+        SQLite file, defaults to DATA_DIR/http_cache.db.
+    ttl
+        Seconds a response is served without contacting the server,
+        defaults to one week. Older responses are revalidated.
+    offline
+        If True, only cached responses are served, regardless of their age.
+
+    Notes
+    -----
+    The cache can be shared between threads, access to the connection is
+    serialized with a lock.
+
+    See Also
+    --------
+    XenoCantoAPI.fetch_page
+    """
+    def __init__(self, path=DATA_DIR / 'http_cache.db', ttl=7 * 24 * 3600,
+                 offline=False):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.offline = offline
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS responses("
+                               "key TEXT PRIMARY KEY,"
+                               "body TEXT,"
+                               "etag TEXT,"
+                               "last_modified TEXT,"
+                               "fetched REAL"
+                               ")")
+
+    @staticmethod
+    def make_key(url, query, page=1):
+        """
+        Builds the cache key of a request.
+        """
+        return f'{url}|{normalize_query(query)}|{page}'
+
+    def get(self, key):
+        """
+        Returns the cached response for key, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched FROM responses "
+                "WHERE key = ?", (key,)).fetchone()
+        return CachedResponse(*row) if row else None
+
+    def is_fresh(self, entry):
+        """
+        Checks whether entry can be served without revalidation.
+        """
+        return self.offline or entry.age() < self.ttl
+
+    def put(self, key, body, etag=None, last_modified=None):
+        """
+        Stores a response body under key.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, etag, "
+                "last_modified, fetched) VALUES (?, ?, ?, ?, ?)",
+                (key, body, etag, last_modified, time.time()))
+
+    def touch(self, key):
+        """
+        Marks the response under key as freshly validated.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE responses SET fetched = ? WHERE key = ?",
+                               (time.time(), key))
+
+    def expire(self, max_age=None):
+        """
+        Removes responses older than max_age seconds, defaults to the TTL.
+
+        Returns
+        -------
+        int
+            Number of removed responses.
+        """
+        cutoff = time.time() - (self.ttl if max_age is None else max_age)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE fetched < ?", (cutoff,))
+        return cursor.rowcount
+
+    def clear(self):
+        """
+        Removes all cached responses.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record(self, outcome):
+        """
+        Counts a lookup, outcome is 'hits', 'revalidated' or 'misses'.
+        """
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        """
+        Returns hit, revalidation and miss counts.
+        """
+        return {'hits': self.hits, 'revalidated': self.revalidated,
+                'misses': self.misses}
@@ -15,12 +15,12 @@
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import requests
 import json
-import time
-import logging
 from pathlib import Path
 from dataclasses import dataclass
 from datetime import datetime
-from src.config import RAW_DATA_DIR, DATA_DIR
+from src.config import RAW_DATA_DIR
+from concurrent.futures import ThreadPoolExecutor
+from .downloader import Downloader, TokenBucket, make_session
 
 class XenoCantoError(Exception):
     pass
@@ -78,35 +78,49 @@ class XenoCantoRecording:
     datetime: datetime
     other_species: str
     filename: str = None
-    def download_recording(self, folder = RAW_DATA_DIR):
+
+    def build_filename(self):
         """
-        Downloads specific recording from XenoCanto database.
+        Builds the file name of the recording,
+        XXXXXX_genus_species_date_country.mp3.
+        Returns
+        -------
+        str
+            File name of the recording.
+        """
+        return (f"{self.recording_id}_{self.gen_species}_"
+                f"{self.specific_species}_"
+                f"{datetime.strftime(self.datetime, '%Y-%m-%d')}_"
+                f"{self.country}.mp3")
+
+    def download_recording(self, folder = RAW_DATA_DIR, downloader = None):
+        """
+        Downloads specific recording from XenoCanto database. The file is
+        streamed to disk in chunks and only appears under its final name
+        once complete. Complete files are skipped and partial downloads are
+        resumed.
         Parameters
         ----------
         folder
-            Path to save the downloaded recording to.
+            Path to save the downloaded recording to. Ignored if downloader
+            is given.
+        downloader
+            Downloader to use, e.g. from XenoCantoAPI, so that downloads in
+            a loop share its session and rate limit. A new one is created
+            if None.
         Returns
         -------
-
+        DownloadResult
+            Outcome of the download.
         """
-        try:
-            filename = (f"{self.recording_id}_{self.gen_species}_"
-                        f"{self.specific_species}_"
-                        f"{datetime.strftime(self.datetime, '%Y-%m-%d')}_"
-                        f"{self.country}.mp3")
-
-            self.filename = filename
-
-            full_path = folder / filename
-
-            response = requests.get(self.file_url)
-
-            with open(full_path, 'wb') as f:
-                f.write(response.content)
-        except requests.RequestException as e:
-            raise XenoCantoAPIError(f"Error downloading {self.recording_id}: {e}")
-        except OSError as e:
-            raise XenoCantoAPIError(f"Error saving {self.recording_id}: {e}")
+        if downloader is None:
+            downloader = Downloader(folder, max_workers=1)
+        downloader.folder.mkdir(parents=True, exist_ok=True)
+        result = downloader.download(self)
+        if result.error:
+            raise XenoCantoAPIError(f"Error downloading {self.recording_id}: "
+                                    f"{result.error}")
+        return result
 
     @staticmethod
     def _parse_length(length):
@@ -213,13 +227,26 @@ class XenoCantoAPI:
     
     Parameters
     ----------
-
+    base_url
+        URL of the recordings endpoint.
+    rate
+        Maximum number of requests per second, shared by searches and
+        downloads.
+    session
+        requests.Session to use. Defaults to a pooled session retrying
+        failed requests with backoff.
+    timeout
+        Connect/read timeout per request, in seconds.
+    cache
+        ResponseCache to serve search results from, None disables caching.
     
     Methods
     ----------
     search_api()
         searches the XenoCanto database for recordings fitting a number of
         arguments. Returns list of XenoCantoRecording objects.
+    iter_search()
+        walks all pages of a search, yielding XenoCantoRecording objects.
     download_recordings()
         Downloads a list of XenoCantoRecording objects.
     
@@ -239,16 +266,101 @@ class XenoCantoAPI:
     XenoCantoRecording
     DatabaseHandler
     """ 
-    def __init__(self):
-        self.base_url = 'https://xeno-canto.org/api/2/recordings'
+    def __init__(self, base_url = 'https://xeno-canto.org/api/2/recordings',
+                 rate = 1.0, session = None, timeout = 30, cache = None):
+        self.base_url = base_url
+        self.rate_limiter = TokenBucket(rate)
+        self.session = session or make_session()
+        self.timeout = timeout
+        self.cache = cache
+
+    @staticmethod
+    def build_query(search_term = "", **kwargs):
+        """
+        Builds the query string of a search, e.g.
+        'Turdus merula cnt:Germany'.
+        """
+        terms = [search_term] if search_term else []
+        terms += [f'{key}:{value}' for key, value in kwargs.items()]
+        return ' '.join(terms)
 
-    def search_api(self, search_term = "", **kwargs):
+    def fetch_page(self, search_term = "", page = 1, **kwargs):
+        """
+        Requests one page of search results. With a cache, fresh responses
+        are served locally and stale ones are revalidated with
+        If-None-Match/If-Modified-Since.
+        Parameters
+        ----------
+        search_term
+            Search term to search for, see search_api().
+        page
+            Page to request, starting at 1.
+        kwargs
+            Other arguments passed to XenoCantoAPI, see search_api().
+        Returns
+        -------
+        dict
+            Decoded JSON response.
+        """
+        query = self.build_query(search_term, **kwargs)
+        params = {'query': query, 'page': page}
+        headers = {}
+        cached = key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.base_url, query, page)
+            cached = self.cache.get(key)
+            if cached is not None and self.cache.is_fresh(cached):
+                self.cache.record('hits')
+                return json.loads(cached.body)
+            if self.cache.offline:
+                raise XenoCantoAPIError(f'Page {page} of "{query}" is not '
+                                        f'cached and the cache is offline')
+            if cached is not None:
+                if cached.etag:
+                    headers['If-None-Match'] = cached.etag
+                if cached.last_modified:
+                    headers['If-Modified-Since'] = cached.last_modified
+
+        self.rate_limiter.acquire()
+        try:
+            result = self.session.get(self.base_url, params=params,
+                                      headers=headers, timeout=self.timeout)
+            if result.status_code == 304 and cached is not None:
+                self.cache.touch(key)
+                self.cache.record('revalidated')
+                return json.loads(cached.body)
+            result.raise_for_status()
+            data = result.json()
+        except (requests.RequestException, ValueError) as e:
+            raise XenoCantoAPIError(f'Request failed: {e}') from e
+        if 'numRecordings' not in data or 'recordings' not in data:
+            raise XenoCantoAPIError(f'Invalid data format: {data}')
+        if self.cache is not None:
+            self.cache.put(key, result.text, result.headers.get('ETag'),
+                           result.headers.get('Last-Modified'))
+            self.cache.record('misses')
+        return data
+
+    @staticmethod
+    def parse_page(data):
+        """
+        Parses the recordings of a page returned by fetch_page().
+        """
+        try:
+            return [XenoCantoRecording.from_json(recording)
+                    for recording in data['recordings']]
+        except (KeyError, ValueError) as e:
+            raise XenoCantoParseError(f'Could not parse data: {data}') from e
+
+    def search_api(self, search_term = "", page = 1, **kwargs):
         """
         Method to search XenoCanto API given a search term and other arguments.
         Parameters
         ----------
         search_term
             Search term to search for, usually a scientific species name.
+        page
+            Page of results to return, defaults to 1.
         kwargs
             Other possible arguments passed to XenoCantoAPI.
             grp: Group such as "birds", "grasshoppers" etc.
@@ -277,73 +389,119 @@ class XenoCantoAPI:
         -------
         list
             List of XenoCantoRecording objects.
-        """
-        time.sleep(1)
-        try:
-            search_url = self.base_url + f'?query={search_term}+'
-            for key, value in kwargs.items():
-                search_url += f'{key}:{value}+'
-            result = requests.get(search_url)
-            result.raise_for_status()
-            data = result.json()
-            if 'numRecordings' not in data or 'recordings' not in data:
-                raise XenoCantoAPIError(f'Invalid data format: {data}')
 
-            print(f'Found {data["numRecordings"]} recordings.')
-            print(f'Found {data["numSpecies"]} species.')
-            print(f'Current page: {data["page"]}/{data["numPages"]}')
-            try:
-                page = int(input('What page would you like to access?'))
-                if page < 1 or page > data['numPages']:
-                    raise ValueError(f'Page must be between 1 and {data["numPages"]}')
-                else:
-                    search_url += f'&page={page}'
-            except ValueError as e:
-                raise XenoCantoAPIError() from e
-
-
-            result = requests.get(search_url)
-            data = result.json()
-            try:
-                recordings = [XenoCantoRecording.from_json(recording) for recording in data['recordings']]
-
-            except (KeyError, ValueError) as e:
-                raise XenoCantoParseError(f'Could not parse data: {data}') from e
+        See Also
+        --------
+        iter_search
+        """
+        data = self.fetch_page(search_term, page, **kwargs)
+        print(f'Found {data["numRecordings"]} recordings.')
+        print(f'Found {data["numSpecies"]} species.')
+        print(f'Current page: {data["page"]}/{data["numPages"]}')
+        return self.parse_page(data)
 
-            return recordings
+    def iter_search(self, search_term = "", pages = None, **kwargs):
+        """
+        Walks the pages of a search, yielding recordings as they are parsed.
+        The next page is requested in the background while the current one
+        is being consumed.
+        Parameters
+        ----------
+        search_term
+            Search term to search for, see search_api().
+        pages
+            Iterable of page numbers to visit, e.g. range(1, 5). None visits
+            all pages.
+        kwargs
+            Other arguments passed to XenoCantoAPI, see search_api().
+        Returns
+        -------
+        Iterator[XenoCantoRecording]
+        """
+        page_numbers = iter(pages) if pages is not None else None
+        first = next(page_numbers, None) if page_numbers is not None else 1
+        if first is None:
+            return
 
-        except requests.RequestException as e:
-            raise XenoCantoAPIError(f'Request failed: {e}') from e
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            future = executor.submit(self.fetch_page, search_term, first,
+                                     **kwargs)
+            n_pages = None
+            while future is not None:
+                data = future.result()
+                if n_pages is None:
+                    n_pages = int(data['numPages'])
+                    print(f'Found {data["numRecordings"]} recordings on '
+                          f'{n_pages} pages.')
+                    if page_numbers is None:
+                        page_numbers = iter(range(first + 1, n_pages + 1))
+
+                next_page = next(page_numbers, None)
+                if next_page is not None and next_page <= n_pages:
+                    future = executor.submit(self.fetch_page, search_term,
+                                             next_page, **kwargs)
+                else:
+                    future = None
+                yield from self.parse_page(data)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
 
-    def download_recordings(self, recordings):
+    def download_recordings(self, recordings, folder = RAW_DATA_DIR,
+                            max_workers = 4, database = None):
         """
-        Helper method to download recordings from XenoCanto.
+        Helper method to download recordings from XenoCanto concurrently,
+        sharing this API's rate limit. Recordings already on disk are
+        skipped and partial downloads are resumed.
         Parameters
         ----------
         recordings
             list of XenoCantoRecording objects to download.
+        folder
+            Path to save the downloaded recordings to.
+        max_workers
+            Number of concurrent downloads.
+        database
+            DatabaseHandler to keep download state in, so complete files are
+            skipped without contacting the server.
         Returns
         -------
+        list
+            DownloadResult per recording.
 
+        See Also
+        --------
+        Downloader
         """
-        for i, recording in enumerate(recordings, 1):
-            recording.download_recording()
-            print(f'Downloaded recording {i}/{len(recordings)}')
-            time.sleep(1)
+        downloader = self._downloader(folder, max_workers)
+        return list(downloader.download_all(recordings, database))
 
+    def _downloader(self, folder, max_workers=1):
+        """
+        Returns a Downloader sharing this API's session, timeout and rate
+        limit.
+        """
+        downloader = Downloader(folder, max_workers=max_workers,
+                                session=self.session, timeout=self.timeout)
+        downloader.rate_limiter = self.rate_limiter
+        return downloader
 
-    def download_recording(self, recording):
+    def download_recording(self, recording, folder = RAW_DATA_DIR):
         """
-        Helper method to download recording from XenoCanto.
+        Helper method to download recording from XenoCanto, sharing this
+        API's session and rate limit.
         Parameters
         ----------
         recording
             XenoCanto recording object to download.
+        folder
+            Path to save the downloaded recording to.
         Returns
         -------
-
+        DownloadResult
+            Outcome of the download.
         """
         print(f'Downloading recording.')
-        recording.download_recording()
-        time.sleep(1)
\ No newline at end of file
+        return recording.download_recording(
+            downloader=self._downloader(folder))
\ No newline at end of file
@@ -1 +1,2 @@
-from .database import *
\ No newline at end of file
+from .database import *
+from .query import *
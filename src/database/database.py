@@ -2,15 +2,22 @@ import sqlite3
 import numpy as np
 import pandas as pd
 import json
+import itertools
 from src.data_acquisition import XenoCantoRecording
 from datetime import datetime
+from .query import AUDIO_STATS_COLUMNS, RECORDING_COLUMNS, RecordingQuery, iter_query, run_query
+
+
 class DatabaseHandler:
     """
     Handles connecting and inserting data into recordings Database
 
     Parameters
     ----------
-
+    database_file
+        Path to the sqlite database file.
+    cache_size_mb
+        Size of sqlite's page cache, in MB.
 
     Returns
     -------
@@ -19,24 +26,71 @@ class DatabaseHandler:
     Notes
     -----
     Creates and adds entries to sqlite database. Cannot remove entries.
+    A single connection in WAL mode is kept open and reused by all
+    methods, see connection(). Use the handler as a context manager or
+    call close() when done.
 
     See Also
     --------
 
     """
-    def __init__(self, database_file):
+    def __init__(self, database_file, cache_size_mb=64):
 
         self.database_file = database_file
+        self.cache_size_mb = cache_size_mb
+        self._conn = None
+        self._schema_created = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def create_and_connect(self):
         """
-        Connects to database, creates table if not existant.
+        Connects to database, creates tables if not existant. Every call
+        opens a new connection, owned by the caller, who may close it.
         Returns
         -------
         sqlite3.Connection
             Connection to database
         """
         conn = sqlite3.connect(self.database_file)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size={-1024 * self.cache_size_mb}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if not self._schema_created:
+            self._create_schema(conn)
+            self._schema_created = True
+        return conn
+
+    def connection(self):
+        """
+        Returns the handler's shared connection, opened with
+        create_and_connect() on first use and reused by all methods until
+        close() is called. Do not close it directly.
+        Returns
+        -------
+        sqlite3.Connection
+            Connection to database
+        """
+        if self._conn is None:
+            self._conn = self.create_and_connect()
+        return self._conn
+
+    def _create_schema(self, conn):
+        """
+        Helper method creating all tables and indexes.
+        Parameters
+        ----------
+        conn
+            Connection to database
+        Returns
+        -------
+        None
+        """
         cursor = conn.cursor()
 
         cursor.execute("CREATE TABLE IF NOT EXISTS recordings("
@@ -70,10 +124,90 @@ class DatabaseHandler:
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_quality ON recordings("
                        "quality)")
 
+        cursor.execute("CREATE TABLE IF NOT EXISTS downloads("
+                       "recording_id INTEGER PRIMARY KEY,"
+                       "filename TEXT,"
+                       "size INTEGER,"
+                       "etag TEXT,"
+                       "completed INTEGER,"
+                       "updated TEXT"
+                       ")")
 
+        cursor.execute("CREATE TABLE IF NOT EXISTS audio_stats("
+                       "recording_id INTEGER PRIMARY KEY,"
+                       "duration REAL,"
+                       "sample_rate INTEGER,"
+                       "rms REAL,"
+                       "peak REAL,"
+                       "clip_ratio REAL,"
+                       "noise_floor_db REAL,"
+                       "snr_db REAL,"
+                       "active_fraction REAL,"
+                       "analyzed TEXT"
+                       ")")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stats_snr ON "
+                       "audio_stats(snr_db)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stats_duration ON "
+                       "audio_stats(duration)")
+
+        self._create_spatial_index(cursor)
 
         conn.commit()
-        return conn
+
+    def _create_spatial_index(self, cursor):
+        """
+        Helper method creating the recordings_rtree R-tree over latitude and
+        longitude, with triggers keeping it in sync with the recordings
+        table. Recordings inserted before the index existed are backfilled.
+        Parameters
+        ----------
+        cursor
+            Cursor of the database connection.
+        Returns
+        -------
+        None
+        """
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS recordings_rtree "
+                       "USING rtree(id, min_lat, max_lat, min_lon, max_lon)")
+        located = ("NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL")
+        insert = ("INSERT OR REPLACE INTO recordings_rtree VALUES (NEW.recording_id, "
+                  "NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);")
+        cursor.execute("CREATE TRIGGER IF NOT EXISTS recordings_rtree_insert "
+                       f"AFTER INSERT ON recordings WHEN {located} "
+                       f"BEGIN {insert} END")
+        cursor.execute("CREATE TRIGGER IF NOT EXISTS recordings_rtree_update "
+                       "AFTER UPDATE OF recording_id, latitude, longitude "
+                       "ON recordings BEGIN "
+                       "DELETE FROM recordings_rtree WHERE id = OLD.recording_id; "
+                       f"INSERT OR REPLACE INTO recordings_rtree SELECT "
+                       "NEW.recording_id, NEW.latitude, NEW.latitude, "
+                       f"NEW.longitude, NEW.longitude WHERE {located}; END")
+        cursor.execute("CREATE TRIGGER IF NOT EXISTS recordings_rtree_delete "
+                       "AFTER DELETE ON recordings BEGIN "
+                       "DELETE FROM recordings_rtree WHERE id = OLD.recording_id; "
+                       "END")
+
+        indexed = cursor.execute("SELECT count(*) FROM recordings_rtree").fetchone()[0]
+        located_rows = cursor.execute(
+            "SELECT count(*) FROM recordings WHERE latitude IS NOT NULL "
+            "AND longitude IS NOT NULL").fetchone()[0]
+        if indexed != located_rows:
+            cursor.execute("DELETE FROM recordings_rtree")
+            cursor.execute("INSERT INTO recordings_rtree SELECT recording_id, "
+                           "latitude, latitude, longitude, longitude "
+                           "FROM recordings WHERE latitude IS NOT NULL "
+                           "AND longitude IS NOT NULL")
+
+    def close(self):
+        """
+        Closes the connection to the database, if open.
+        Returns
+        -------
+        None
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
 
     def _dump_to_json(self, list_to_dump):
         """
@@ -113,33 +247,194 @@ class DatabaseHandler:
         Returns
         -------
         None
+
+        See Also
+        --------
+        upload_recordings
+        """
+        self.upload_recordings([recording])
+
+    def get_download_states(self, recording_ids=None):
+        """
+        Reads the stored download state of recordings.
+        Parameters
+        ----------
+        recording_ids
+            Recording ids to look up, all recordings if None.
+        Returns
+        -------
+        dict
+            Mapping of recording_id to a dict with filename, size, etag and
+            completed keys.
+        """
+        cursor = self.connection().cursor()
+        query = ("SELECT recording_id, filename, size, etag, completed "
+                 "FROM downloads")
+        if recording_ids is None:
+            rows = cursor.execute(query).fetchall()
+        else:
+            ids = list(recording_ids)
+            rows = []
+            for i in range(0, len(ids), 900):
+                chunk = ids[i:i + 900]
+                placeholders = ','.join(['?'] * len(chunk))
+                rows += cursor.execute(
+                    f"{query} WHERE recording_id IN ({placeholders})",
+                    chunk).fetchall()
+        return {row[0]: {'filename': row[1], 'size': row[2], 'etag': row[3],
+                         'completed': bool(row[4])}
+                for row in rows}
+
+    def update_download_states(self, states):
+        """
+        Inserts or replaces the download state of recordings.
+        Parameters
+        ----------
+        states
+            Iterable of dicts with recording_id, filename, size, etag and
+            completed keys, e.g. from DownloadResult.state().
+        Returns
+        -------
+        None
         """
-        conn = self.create_and_connect()
-        recording_temp = recording
-        recording_temp.other_species = self._dump_to_json(recording_temp.other_species)
-        recording_temp.datetime = recording.datetime.strftime("%Y-%m-%d %H:%M:%S")
+        updated = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = [(state['recording_id'], state['filename'], state['size'],
+                 state['etag'], int(state['completed']), updated)
+                for state in states]
+        conn = self.connection()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO downloads (recording_id, "
+                             "filename, size, etag, completed, updated) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", rows)
 
-        recording_dict = recording_temp.__dict__
-        fields = ','.join(recording_dict.keys())
-        placeholders = ','.join(['?'] * len(recording_dict.keys()))
-        values = tuple(recording_dict.values())
+    def _recording_row(self, recording: XenoCantoRecording):
+        """
+        Helper method converting a recording to a row of RECORDING_COLUMNS
+        without modifying it.
+        Parameters
+        ----------
+        recording
+            XenoCantoRecording object optained from XenoCantoAPI
+        Returns
+        -------
+        tuple
+            Column values in the order of RECORDING_COLUMNS.
+        """
+        values = dict(recording.__dict__)
+        if not isinstance(values['other_species'], str):
+            values['other_species'] = self._dump_to_json(values['other_species'])
+        if isinstance(values['datetime'], datetime):
+            values['datetime'] = values['datetime'].strftime("%Y-%m-%d %H:%M:%S")
+        return tuple(values[column] for column in RECORDING_COLUMNS)
 
-        query = (f"INSERT or IGNORE INTO recordings ({fields}) VALUES "
-                 f"({placeholders})")
+    def upload_recordings(self, recordings, batch_size=None):
+        """
+        Method to upload many recordings to database with executemany.
+        Recordings already in the database are ignored.
+        Parameters
+        ----------
+        recordings
+            Iterable of XenoCantoRecording objects.
+        batch_size
+            Number of rows inserted per transaction. None (default) inserts
+            all rows in a single transaction.
+        Returns
+        -------
+        int
+            Number of newly inserted rows.
+        """
+        query = (f"INSERT OR IGNORE INTO recordings "
+                 f"({','.join(RECORDING_COLUMNS)}) VALUES "
+                 f"({','.join(['?'] * len(RECORDING_COLUMNS))})")
+        conn = self.connection()
+        rows = (self._recording_row(recording) for recording in recordings)
+        if batch_size is None:
+            with conn:
+                return conn.executemany(query, rows).rowcount
 
-        cursor = conn.cursor()
-        cursor.execute(query, values)
-        conn.commit()
+        inserted = 0
+        while batch := list(itertools.islice(rows, batch_size)):
+            with conn:
+                inserted += conn.executemany(query, batch).rowcount
+        return inserted
+
+    def analyzed_recordings(self):
+        """
+        Returns the ids of all recordings with stats in audio_stats.
+        Returns
+        -------
+        set
+            Recording ids.
+        """
+        cursor = self.connection().execute(
+            "SELECT recording_id FROM audio_stats")
+        return {row[0] for row in cursor}
+
+    def upload_audio_stats(self, stats):
+        """
+        Inserts or replaces audio statistics of recordings.
+        Parameters
+        ----------
+        stats
+            Iterable of dicts with recording_id and the AUDIO_STATS_COLUMNS
+            keys, e.g. from dataset.audio_stats.compute_audio_stats().
+        Returns
+        -------
+        None
+        """
+        analyzed = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        columns = ('recording_id', *AUDIO_STATS_COLUMNS)
+        rows = [tuple(row[column] for column in columns) + (analyzed,)
+                for row in stats]
+        conn = self.connection()
+        with conn:
+            conn.executemany(f"INSERT OR REPLACE INTO audio_stats "
+                             f"({', '.join(columns)}, analyzed) VALUES "
+                             f"({', '.join(['?'] * (len(columns) + 1))})", rows)
+
+    def query(self, query=None, as_frame=True, chunk_size=None, **filters):
+        """
+        Method to select recordings, returning the result column-oriented.
+        Parameters
+        ----------
+        query
+            RecordingQuery to run. If None, one is built from filters.
+        as_frame
+            If True (default), returns a DataFrame, else a dict of column
+            name to NumPy array.
+        chunk_size
+            If given, returns an iterator over chunks of this many rows
+            instead of the whole result.
+        filters
+            Fields of RecordingQuery, e.g. species='Turdus merula',
+            max_quality='B', columns=('recording_id', 'filename').
+        Returns
+        -------
+        pd.DataFrame | dict | Iterator
+            Selected rows.
+
+        See Also
+        --------
+        RecordingQuery
+        """
+        query = query or RecordingQuery(**filters)
+        conn = self.connection()
+        if chunk_size is not None:
+            return iter_query(conn, query, chunk_size, as_frame)
+        return run_query(conn, query, as_frame=as_frame)
 
     def reset_db(self):
         """
-        Helper method to reset database
+        Helper method to reset database, dropping all tables and creating
+        empty ones.
         Returns
         -------
         None
         """
-        conn = self.create_and_connect()
-        cursor = conn.cursor()
-        cursor.execute("DROP TABLE IF EXISTS recordings")
-        conn.commit()
-        conn.close()
+        conn = self.connection()
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS recordings")
+            conn.execute("DROP TABLE IF EXISTS downloads")
+            conn.execute("DROP TABLE IF EXISTS recordings_rtree")
+            conn.execute("DROP TABLE IF EXISTS audio_stats")
+        self._create_schema(conn)
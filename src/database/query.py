@@ -0,0 +1,363 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+RECORDING_COLUMNS = ('recording_id', 'gen_species', 'specific_species',
+                     'specific_subspecies', 'animal_group', 'en_name',
+                     'country', 'location', 'latitude', 'longitude', 'type',
+                     'sex', 'stage', 'file_url', 'quality', 'length',
+                     'datetime', 'other_species', 'filename')
+
+AUDIO_STATS_COLUMNS = ('duration', 'sample_rate', 'rms', 'peak', 'clip_ratio',
+                       'noise_floor_db', 'snr_db', 'active_fraction')
+
+COLUMN_DTYPES = {'recording_id': np.int64, 'latitude': np.float64,
+                 'longitude': np.float64, 'length': np.float64}
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance between points in degrees, in km. Works
+    element-wise on arrays.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def radius_bbox(lat, lon, radius_km):
+    """
+    Bounding box (lat_min, lon_min, lat_max, lon_max) containing all points
+    within radius_km of (lat, lon). lon_min > lon_max if the box crosses
+    the antimeridian, the longitude range is (-180, 180) near the poles.
+    """
+    delta_lat = np.degrees(radius_km / EARTH_RADIUS_KM)
+    lat_min, lat_max = lat - delta_lat, lat + delta_lat
+    if lat_min <= -90 or lat_max >= 90:
+        return max(lat_min, -90.0), -180.0, min(lat_max, 90.0), 180.0
+    delta_lon = np.degrees(np.arcsin(np.sin(np.radians(delta_lat))
+                                     / np.cos(np.radians(lat))))
+    if delta_lon >= 180:
+        return lat_min, -180.0, lat_max, 180.0
+    lon_min = (lon - delta_lon + 180) % 360 - 180
+    lon_max = (lon + delta_lon + 180) % 360 - 180
+    return lat_min, lon_min, lat_max, lon_max
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+@dataclass
+class RecordingQuery:
+    """
+    Filters and columns of a query over the recordings table. All filters
+    are optional and combined with AND.
+
+    Parameters
+    ----------
+    species: str | list
+        Scientific name(s) such as 'Turdus merula'. A single word matches
+        the genus.
+    country: str | list
+        Country or countries.
+    min_quality, max_quality: str
+        Quality range, 'A' is best. min_quality='A', max_quality='C' selects
+        A, B and C.
+    min_length, max_length: float
+        Length range of the recording, in seconds.
+    start, end: str | datetime
+        Range of recording dates, inclusive. Strings are compared as
+        'YYYY-MM-DD HH:MM:SS'.
+    type: str
+        Pattern matched against the call type with LIKE, e.g. '%song%'.
+    bbox: tuple
+        (lat_min, lon_min, lat_max, lon_max) in degrees, the order of
+        Xeno-canto's box filter. lon_min > lon_max selects a box crossing
+        the antimeridian.
+    near: tuple
+        (lat, lon) center of a radius search, in degrees.
+    radius_km: float
+        Radius around near, in km.
+    min_snr, max_snr: float
+        Range of the estimated SNR, in dB.
+    min_duration, max_duration: float
+        Range of the decoded duration, in seconds.
+    min_active_fraction: float
+        Minimum fraction of frames inside detected calls.
+    max_clip_ratio: float
+        Maximum fraction of clipped samples.
+    columns: tuple
+        Columns to return, all if None.
+    order_by: str
+        Column to sort by, defaults to recording_id.
+    limit: int
+        Maximum number of rows.
+
+    Notes
+    -----
+    Species, country and quality filters use the idx_species, idx_location
+    and idx_quality indexes. Column names are checked against
+    RECORDING_COLUMNS, values are always passed as parameters.
+
+    bbox and radius filters select candidates through the recordings_rtree
+    R-tree. Radius candidates are then refined with the exact haversine
+    distance, computed vectorized on each fetched chunk.
+
+    Audio statistics filters select from the audio_stats table, so they
+    only match recordings analyzed with dataset.analyze_recordings().
+
+    See Also
+    --------
+    DatabaseHandler.query
+    iter_query
+    """
+    species: str | list = None
+    country: str | list = None
+    min_quality: str = None
+    max_quality: str = None
+    min_length: float = None
+    max_length: float = None
+    start: str | datetime = None
+    end: str | datetime = None
+    type: str = None
+    bbox: tuple = None
+    near: tuple = None
+    radius_km: float = None
+    min_snr: float = None
+    max_snr: float = None
+    min_duration: float = None
+    max_duration: float = None
+    min_active_fraction: float = None
+    max_clip_ratio: float = None
+    columns: tuple = None
+    order_by: str = 'recording_id'
+    limit: int = None
+
+    def selected_columns(self):
+        columns = tuple(self.columns) if self.columns else RECORDING_COLUMNS
+        unknown = [column for column in (*columns, self.order_by)
+                   if column is not None and column not in RECORDING_COLUMNS]
+        if unknown:
+            raise ValueError(f'Unknown columns: {unknown}')
+        return columns
+
+    def fetched_columns(self):
+        """
+        Returns the selected columns plus the coordinates needed to refine
+        a radius search.
+        """
+        columns = self.selected_columns()
+        if self.near is not None:
+            columns += tuple(column for column in ('latitude', 'longitude')
+                             if column not in columns)
+        return columns
+
+    def refine(self, chunk):
+        """
+        Returns a mask of the rows of chunk within radius_km of near.
+        """
+        distance = haversine_km(self.near[0], self.near[1],
+                                chunk['latitude'], chunk['longitude'])
+        return distance <= self.radius_km
+
+    @staticmethod
+    def _box_condition(box):
+        """
+        R-tree lookup of the candidates in box plus the exact test on the
+        stored coordinates, as the R-tree rounds to 32-bit floats.
+        """
+        lat_min, lon_min, lat_max, lon_max = map(float, box)
+        joiner = 'AND' if lon_min <= lon_max else 'OR'
+        condition = ('recording_id IN (SELECT id FROM recordings_rtree WHERE '
+                     'max_lat >= ? AND min_lat <= ? '
+                     f'AND (max_lon >= ? {joiner} min_lon <= ?)) '
+                     'AND latitude BETWEEN ? AND ? '
+                     f'AND (longitude >= ? {joiner} longitude <= ?)')
+        return condition, [lat_min, lat_max, lon_min, lon_max] * 2
+
+    def conditions(self):
+        """
+        Returns the WHERE conditions and their parameters.
+
+        Returns
+        -------
+        tuple
+            (list of SQL conditions, list of parameters)
+        """
+        conditions, params = [], []
+
+        species = _as_list(self.species)
+        if species:
+            alternatives = []
+            for name in species:
+                parts = name.split()
+                if len(parts) == 1:
+                    alternatives.append('gen_species = ?')
+                else:
+                    alternatives.append('(gen_species = ? AND specific_species = ?)')
+                params += parts[:2]
+            conditions.append(f"({' OR '.join(alternatives)})")
+
+        countries = _as_list(self.country)
+        if countries:
+            conditions.append(f"country IN ({','.join(['?'] * len(countries))})")
+            params += countries
+
+        for column, operator, value in (
+                ('quality', '>=', self.min_quality),
+                ('quality', '<=', self.max_quality),
+                ('length', '>=', self.min_length),
+                ('length', '<=', self.max_length),
+                ('datetime', '>=', _as_date(self.start)),
+                ('datetime', '<=', _as_date(self.end)),
+                ('type', 'LIKE', self.type)):
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                params.append(value)
+
+        stats_conditions = []
+        for column, operator, value in (
+                ('snr_db', '>=', self.min_snr),
+                ('snr_db', '<=', self.max_snr),
+                ('duration', '>=', self.min_duration),
+                ('duration', '<=', self.max_duration),
+                ('active_fraction', '>=', self.min_active_fraction),
+                ('clip_ratio', '<=', self.max_clip_ratio)):
+            if value is not None:
+                stats_conditions.append(f'{column} {operator} ?')
+                params.append(value)
+        if stats_conditions:
+            conditions.append('recording_id IN (SELECT recording_id FROM '
+                              f"audio_stats WHERE {' AND '.join(stats_conditions)})")
+
+        if self.bbox is not None:
+            condition, box_params = self._box_condition(self.bbox)
+            conditions.append(condition)
+            params += box_params
+        if self.near is not None:
+            if self.radius_km is None:
+                raise ValueError('near requires radius_km')
+            condition, box_params = self._box_condition(
+                radius_bbox(*self.near, self.radius_km))
+            conditions.append(condition)
+            params += box_params
+        return conditions, params
+
+    def to_sql(self):
+        """
+        Builds the parameterized SELECT statement.
+
+        Returns
+        -------
+        tuple
+            (SQL string, list of parameters)
+        """
+        columns = self.fetched_columns()
+        conditions, params = self.conditions()
+        sql = f"SELECT {', '.join(columns)} FROM recordings"
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        if self.order_by:
+            sql += f' ORDER BY {self.order_by}'
+        if self.limit is not None and self.near is None:
+            sql += ' LIMIT ?'
+            params.append(int(self.limit))
+        return sql, params
+
+
+def _to_columns(rows, columns):
+    """
+    Transposes fetched rows into one NumPy array per column.
+    """
+    if not rows:
+        return {column: np.array([], dtype=COLUMN_DTYPES.get(column, object))
+                for column in columns}
+    return {column: np.array(values, dtype=COLUMN_DTYPES.get(column, object))
+            for column, values in zip(columns, zip(*rows))}
+
+
+def iter_query(conn, query, chunk_size=10000, as_frame=False):
+    """
+    Runs a RecordingQuery and yields the result in chunks.
+
+    Parameters
+    ----------
+    conn
+        sqlite3.Connection to the recordings database.
+    query
+        RecordingQuery to run.
+    chunk_size
+        Number of rows per chunk.
+    as_frame
+        If True, chunks are DataFrames instead of dicts of arrays.
+
+    Returns
+    -------
+    Iterator[dict | pd.DataFrame]
+        Column name to array per chunk. At most chunk_size rows are held
+        as Python objects at a time.
+    """
+    columns = query.fetched_columns()
+    selected = query.selected_columns()
+    sql, params = query.to_sql()
+    cursor = conn.execute(sql, params)
+    remaining = query.limit
+    while rows := cursor.fetchmany(chunk_size):
+        chunk = _to_columns(rows, columns)
+        if query.near is not None:
+            mask = query.refine(chunk)
+            if remaining is not None:
+                mask &= np.cumsum(mask) <= remaining
+                remaining -= int(mask.sum())
+            chunk = {column: chunk[column][mask] for column in selected}
+        yield pd.DataFrame(chunk) if as_frame else chunk
+        if remaining is not None and remaining <= 0:
+            break
+
+
+def run_query(conn, query, chunk_size=10000, as_frame=True):
+    """
+    Runs a RecordingQuery and returns the whole result column-oriented,
+    see iter_query().
+
+    Returns
+    -------
+    pd.DataFrame | dict
+        DataFrame, or dict of column name to array if as_frame is False.
+    """
+    chunks = list(iter_query(conn, query, chunk_size))
+    if chunks:
+        result = {column: np.concatenate([chunk[column] for chunk in chunks])
+                  for column in chunks[0]}
+    else:
+        result = _to_columns([], query.selected_columns())
+    return pd.DataFrame(result) if as_frame else result
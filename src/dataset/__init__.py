@@ -1 +1,6 @@
-from .creation import *
\ No newline at end of file
+from .creation import *
+from .features import *
+from .soundscape import *
+from .audio_stats import *
+from .feature_store import *
+from .scaling import *
@@ -0,0 +1,158 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import time
+from pathlib import Path
+
+import numpy as np
+import librosa
+
+from src.audio_processing.noise_reduction import estimate_noise_floor
+from src.audio_processing.segmentation import detect_events, intervals_to_mask
+from src.config import RAW_DATA_DIR
+from src.core.audio_store import AUDIO_EXTENSIONS, load_audio
+from src.core.parallel import imap_bounded
+
+CLIP_LEVEL = 0.999
+
+
+def compute_audio_stats(y, sr, n_fft=2048, hop_length=512):
+    """
+    Computes cheap summary statistics of a decoded recording.
+
+    Parameters
+    ----------
+    y
+        Audio signal, from librosa.load()
+    sr
+        Sampling rate, in Hz.
+    n_fft
+        FFT window size, defaults to 2048.
+    hop_length
+        Number of samples between frames, defaults to 512.
+
+    Returns
+    -------
+    dict
+        duration (s), sample_rate (Hz), rms, peak, clip_ratio (fraction of
+        samples at full scale), noise_floor_db (mean noise power per STFT bin),
+        snr_db (power of active frames over the noise floor) and
+        active_fraction (fraction of frames inside detected calls).
+    """
+    y = np.asarray(y)
+    if y.size == 0:
+        raise ValueError('Empty audio signal')
+    magnitude = np.abs(y)
+    power = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length)) ** 2
+
+    noise = float(estimate_noise_floor(power).mean())
+    events = detect_events(power, sr, hop_length=hop_length)
+    active = intervals_to_mask(events, power.shape[1], sr, hop_length)
+    frame_power = power.mean(axis=0)
+    signal = frame_power[active].mean() if active.any() else frame_power.mean()
+
+    return {'duration': len(y) / sr,
+            'sample_rate': int(sr),
+            'rms': float(np.sqrt(np.mean(np.square(y, dtype=np.float64)))),
+            'peak': float(magnitude.max()),
+            'clip_ratio': float(np.mean(magnitude >= CLIP_LEVEL)),
+            'noise_floor_db': float(10 * np.log10(max(noise, 1e-20))),
+            'snr_db': float(10 * np.log10(max(signal, 1e-20) / max(noise, 1e-20))),
+            'active_fraction': float(active.mean())}
+
+
+def _analyze_task(task):
+    filename, sr, store = task
+    try:
+        recording_id = int(Path(filename).name.split('_')[0])
+        y, sr = load_audio(filename, sr, store=store)
+        return recording_id, filename, compute_audio_stats(y, sr), None
+    except Exception as e:
+        return None, filename, None, f'{type(e).__name__}: {e}'
+
+
+def analyze_recordings(database, files=None, sr=22050, n_workers=None,
+                       store=None, overwrite=False, commit_every=200):
+    """
+    Computes compute_audio_stats() for many recordings in parallel and
+    stores them in the audio_stats table. Recordings already analyzed are
+    skipped.
+
+    Parameters
+    ----------
+    database
+        DatabaseHandler to read analyzed recordings from and write stats to.
+    files
+        Paths to audio files. Defaults to all audio files in RAW_DATA_DIR.
+    sr
+        Sampling rate to decode with, in Hz.
+    n_workers
+        Number of worker processes, None uses all cores, 1 runs serially.
+    store
+        AudioStore to read decoded audio from, see
+        core.audio_store.load_audio().
+    overwrite
+        If True, recordings are analyzed again even if stats exist.
+    commit_every
+        Number of results after which stats are written.
+
+    Returns
+    -------
+    dict
+        Mapping of file name to error message for files that failed.
+
+    Notes
+    -----
+    Workers only decode and compute. All database access happens in the
+    calling process.
+    """
+    if files is None:
+        files = [path for path in sorted(Path(RAW_DATA_DIR).iterdir())
+                 if path.suffix.lower() in AUDIO_EXTENSIONS]
+    done = set() if overwrite else database.analyzed_recordings()
+    tasks = []
+    for filename in files:
+        try:
+            recording_id = int(Path(filename).name.split('_')[0])
+        except ValueError:
+            recording_id = None
+        if recording_id not in done:
+            tasks.append((filename, sr, store))
+    print(f'Analyzing {len(tasks)} recordings, '
+          f'{len(files) - len(tasks)} already analyzed.')
+
+    start = time.perf_counter()
+    errors = {}
+    pending = []
+    for i, (recording_id, filename, stats, error) in enumerate(
+            imap_bounded(_analyze_task, tasks, n_workers=n_workers,
+                         ordered=False), 1):
+        if error:
+            errors[Path(filename).name] = error
+            print(f'Could not analyze {Path(filename).name}: {error}')
+        else:
+            pending.append({'recording_id': recording_id, **stats})
+        if len(pending) >= commit_every:
+            database.upload_audio_stats(pending)
+            pending = []
+        if i % 100 == 0:
+            print(f'Analyzed {i}/{len(tasks)}')
+    if pending:
+        database.upload_audio_stats(pending)
+
+    elapsed = time.perf_counter() - start
+    print(f'Analyzed {len(tasks) - len(errors)} recordings in {elapsed:.1f} s, '
+          f'{len(errors)} failed.')
+    return errors
@@ -1,43 +1,110 @@
+import os
+
 import numpy as np
-import librosa
-import librosa.feature
+from dataclasses import dataclass
+from pathlib import Path
 from sklearn.preprocessing import StandardScaler
 
+from src.config import RAW_DATA_DIR
+from src.core.audio_store import load_audio
+from src.core.parallel import chunked, imap_bounded
+from .features import FeatureExtractor, FEATURE_CONFIG_VERSION
+from .feature_store import FEATURE_VECTOR_KEYS, feature_vector
+from .scaling import StreamingScaler
+
+COMBINED_FEATURES = ('mfcc', 'centroid', 'rolloff', 'rms')
+
+_extractor = FeatureExtractor(COMBINED_FEATURES)
+
 #TODO: Refactor to using Call DataClass
-def create_combined_features(y, sr):
-    # Extract features
-    mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=8, n_fft=512, hop_length=512, fmin= 4000, fmax = 8000)
-    centroid = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-    bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)[0]
-    rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-    zcr = librosa.feature.zero_crossing_rate(y)[0]
-    rms = librosa.feature.rms(y=y)[0]
-
-    feature_dict = {
-        'mfcc_means': np.mean(mfccs, axis=1),  # 13 values
-        'mfcc_stds': np.std(mfccs, axis=1),    # 13 values
-        'centroid_mean': np.mean(centroid),     # 1 value
-        'centroid_std': np.std(centroid),       # 1 value
-        'rolloff_mean': np.mean(rolloff),
-        'rolloff_std': np.std(rolloff),
-        'rms_mean': np.mean(rms),
-        'rms_std': np.std(rms)
-    }
-
-    return feature_dict
+def create_combined_features(y, sr, extractor=None, segments=None):
+    """
+    Extracts the summary features used for the dataset from an audio clip.
+
+    Parameters
+    ----------
+    y
+        Audio signal, from librosa.load()
+    sr
+        Sampling rate, in Hz.
+    extractor
+        FeatureExtractor to use. Defaults to a module-level extractor for
+        COMBINED_FEATURES, whose timings can be printed with
+        get_extractor().report_timings(). iter_dataset() merges the
+        timings of its worker processes into it.
+    segments
+        None uses the whole clip. 'auto' detects calls and only summarizes
+        frames inside them, an array of (start, end) intervals in seconds
+        does the same for given intervals.
+
+    Returns
+    -------
+    dict
+        mfcc_means, mfcc_stds (8 values each), centroid_mean, centroid_std,
+        rolloff_mean, rolloff_std, rms_mean, rms_std.
+    """
+    if extractor is None:
+        extractor = _extractor
+    return extractor.extract(y, sr, segments=segments)
+
+def get_extractor():
+    """
+    Returns the default FeatureExtractor used by create_combined_features.
+    """
+    return _extractor
+
+def load_features(path, sr=22050, cache=None, offset=0.0, duration=None,
+                  segments=None):
+    """
+    Loads an audio file and extracts its combined features, consulting a
+    FeatureCache first so unchanged files are neither decoded nor
+    featurized again. Audio is read from the decoded AudioStore if the
+    file was ingested.
+
+    Parameters
+    ----------
+    path
+        Path to audio file.
+    sr
+        Sample rate to load audio with, in Hz.
+    cache
+        Optional FeatureCache.
+    offset
+        Start of the window to analyze, in seconds.
+    duration
+        Length of the window to analyze in seconds, None analyzes until
+        the end of the file. Only the window is decoded.
+    segments
+        None or 'auto', see create_combined_features().
+
+    Returns
+    -------
+    dict
+        Same as create_combined_features().
+    """
+    key = None
+    if cache is not None:
+        key = cache.make_key(path, sr, 'combined_features',
+                             version=FEATURE_CONFIG_VERSION,
+                             features=COMBINED_FEATURES, offset=offset,
+                             duration=duration, segments=segments)
+        cached = cache.get(key)
+        if cached is not None:
+            return {name: value if value.ndim else value.item()
+                    for name, value in cached.items()}
+
+    y, sr = load_audio(path, sr, offset=offset, duration=duration)
+    features = create_combined_features(y, sr, segments=segments)
+    if cache is not None:
+        cache.put(key, features)
+    return features
 
 def scale_features(feature_dict):
+    # Normalizes a single clip against itself, see StreamingScaler for
+    # dataset-wide normalization.
     # Convert dictionary to flat array
-    features = np.concatenate([
-        feature_dict['mfcc_means'],
-        feature_dict['mfcc_stds'],
-        [feature_dict['centroid_mean'],
-         feature_dict['centroid_std'],
-         feature_dict['rolloff_mean'],
-         feature_dict['rolloff_std'],
-         feature_dict['rms_mean'],
-         feature_dict['rms_std']]
-    ])
+    features = np.concatenate([np.ravel(feature_dict[key])
+                               for key in FEATURE_VECTOR_KEYS])
 
     # Scale features
     scaler = StandardScaler()
@@ -46,23 +113,253 @@ def scale_features(feature_dict):
     scaled_features = scaler.transform(features, copy = True)
     return scaled_features
 
-def build_dataset(files):
-    all_features = []
-    all_labels = []
+@dataclass
+class DatasetItem:
+    """
+    Result of processing a single audio file for the dataset.
 
-    for audio_file in files:
-        y, sr = librosa.load('../data/raw/' + audio_file)
-        features = create_combined_features(y, sr)
-        scaled_features = scale_features(features)
-        all_features.append(scaled_features)
+    Parameters
+    ----------
+    filename: str
+        Audio file name, as passed to build_dataset().
+    label: str
+        Species label parsed from the filename.
+    features: np.ndarray
+        Scaled feature vector of shape (n_features, 1), None on failure
+        or if scaling was skipped.
+    vector: np.ndarray
+        Unscaled float32 feature vector of shape (n_features,), None on
+        failure.
+    error: str
+        Error message if the file could not be processed, else None.
+    cached: bool
+        Whether the features were served from the FeatureCache.
+    """
+    filename: str
+    label: str
+    features: np.ndarray = None
+    vector: np.ndarray = None
+    error: str = None
+    cached: bool = False
 
-        species_idx = 7
-        while(audio_file[species_idx].isdigit() == False):
-            species_idx += 1
-        species_idx -=1
+    @property
+    def recording_id(self):
+        return int(Path(self.filename).name.split('_')[0])
 
-        species = audio_file[7:species_idx]
+def label_from_filename(audio_file):
+    """
+    Parses the species label from a filename of the form
+    XXXXXX_genus_species_date_country.mp3.
 
-        all_labels.append(species)
-    return all_features, all_labels
+    Parameters
+    ----------
+    audio_file
+        File name or path.
+
+    Returns
+    -------
+    str
+        Species label, e.g. Turdus_merula.
+    """
+    parts = Path(audio_file).name.split('_')[1:]
+    species_parts = []
+    for part in parts:
+        if part[:1].isdigit():
+            break
+        species_parts.append(part)
+    return '_'.join(species_parts)
 
+def _process_file(audio_file, data_dir, options):
+    label = label_from_filename(audio_file)
+    options = dict(options)
+    scale = options.pop('scale', True)
+    cache = options.get('cache')
+    try:
+        hits = cache.hits if cache is not None else 0
+        features = load_features(Path(data_dir) / audio_file, **options)
+        cached = cache is not None and cache.hits > hits
+        return DatasetItem(audio_file, label,
+                           scale_features(features) if scale else None,
+                           feature_vector(features), cached=cached)
+    except Exception as e:
+        return DatasetItem(audio_file, label, error=f'{type(e).__name__}: {e}')
+
+def _process_chunk(task):
+    chunk, data_dir, options = task
+    timings, n_clips = dict(_extractor.timings), _extractor.n_clips
+    items = [_process_file(audio_file, data_dir, options) for audio_file in chunk]
+    vectors = [item.vector for item in items if item.error is None]
+    stats = StreamingScaler().partial_fit(np.stack(vectors)) if vectors else None
+    timings = {name: seconds - timings.get(name, 0.0)
+               for name, seconds in _extractor.timings.items()}
+    return items, stats, (os.getpid(), timings, _extractor.n_clips - n_clips)
+
+def iter_dataset(files, data_dir=RAW_DATA_DIR, sr=22050, n_workers=1,
+                 chunksize=8, ordered=True, cache=None, offset=0.0,
+                 duration=None, segment=False, scaler=None, scale=True):
+    """
+    Extracts features for every file, yielding results as they are
+    finished. Files are processed in chunks by a process pool, with a
+    bounded number of chunks in flight, so memory does not grow with the
+    number of files.
+
+    Parameters
+    ----------
+    files
+        Iterable of audio file names, relative to data_dir.
+    data_dir
+        Directory containing the audio files, defaults to RAW_DATA_DIR.
+    sr
+        Sample rate to load audio with, in Hz.
+    n_workers
+        Number of worker processes. None uses all cores, 1 (default) runs
+        serially in the calling process.
+    chunksize
+        Number of files handed to a worker per task.
+    ordered
+        If True, items are yielded in the order of files. If False, in
+        order of completion.
+    cache
+        Optional FeatureCache, consulted before decoding a file.
+    offset
+        Start of the analyzed window in every file, in seconds.
+    duration
+        Length of the analyzed window in seconds, None analyzes whole
+        files.
+    segment
+        If True, features are only computed over detected calls.
+    scaler
+        Optional StreamingScaler. Every worker computes the statistics of
+        its chunk, which are merged into scaler as chunks arrive.
+    scale
+        If True (default), every item gets its features scaled with
+        scale_features(). Pass False when only the unscaled vectors are
+        used, e.g. with a dataset-wide scaler.
+
+    Returns
+    -------
+    Iterator[DatasetItem]
+        One item per file. Files that failed have error set and features
+        None. With scale=False, features is None for all items.
+
+    See Also
+    --------
+    build_dataset
+    """
+    options = {'sr': sr, 'cache': cache, 'offset': offset,
+               'duration': duration, 'segments': 'auto' if segment else None,
+               'scale': scale}
+    tasks = ((chunk, data_dir, options) for chunk in chunked(files, chunksize))
+    for items, stats, (pid, timings, n_clips) in imap_bounded(
+            _process_chunk, tasks, n_workers=n_workers, ordered=ordered):
+        if scaler is not None and stats is not None:
+            scaler.merge(stats)
+        if pid != os.getpid():
+            # Timings of worker processes are lost unless passed back
+            _extractor.merge_timings(timings, n_clips)
+        yield from items
+
+def build_dataset(files, data_dir=RAW_DATA_DIR, sr=22050, n_workers=1,
+                  chunksize=8, ordered=True, cache=None, offset=0.0,
+                  duration=None, segment=False, store=None, scaler=None,
+                  fit_scaler=True):
+    """
+    Builds feature vectors and species labels for a list of audio files.
+
+    Parameters
+    ----------
+    files
+        Iterable of audio file names, relative to data_dir.
+    data_dir
+        Directory containing the audio files, defaults to RAW_DATA_DIR.
+    sr
+        Sample rate to load audio with, in Hz.
+    n_workers
+        Number of worker processes. None uses all cores, 1 (default) runs
+        serially in the calling process.
+    chunksize
+        Number of files handed to a worker per task.
+    ordered
+        If True, results keep the order of files.
+    cache
+        Optional FeatureCache. Only files that changed since they were
+        cached are decoded and featurized.
+    offset
+        Start of the analyzed window in every file, in seconds.
+    duration
+        Length of the analyzed window in seconds, None analyzes whole
+        files.
+    segment
+        If True, features are only computed over detected calls.
+    store
+        Optional FeatureStore. The unscaled vectors of all files are
+        written to it in one transaction, as segment 0 of the current
+        FEATURE_CONFIG_VERSION. Only whole-recording features are stored,
+        so store cannot be combined with offset, duration or segment.
+    scaler
+        Optional StreamingScaler for dataset-wide normalization. If given,
+        the unscaled vectors are stacked and standardized in one step with
+        its statistics, instead of scaling every file on its own.
+    fit_scaler
+        If True (default), statistics of this build are merged into scaler
+        before transforming. Pass False to apply a scaler fitted earlier,
+        e.g. on the training set.
+
+    Returns
+    -------
+    list | np.ndarray
+        Scaled feature vectors, one (n_features, 1) array per file. With a
+        scaler, a single (n_files, n_features) float32 matrix.
+    list
+        Species labels.
+
+    Notes
+    -----
+    Files that fail to load are skipped and reported, they do not abort
+    the build. Use iter_dataset() to handle failures yourself.
+    """
+    if store is not None and (offset or duration is not None or segment):
+        raise ValueError('store only holds whole-recording features, it '
+                         'cannot be combined with offset, duration or segment')
+    all_features = []
+    all_labels = []
+    stored_ids = []
+    stored_vectors = []
+    failures = 0
+    cached = 0
+
+    for item in iter_dataset(files, data_dir=data_dir, sr=sr,
+                             n_workers=n_workers, chunksize=chunksize,
+                             ordered=ordered, cache=cache, offset=offset,
+                             duration=duration, segment=segment,
+                             scaler=scaler if fit_scaler else None,
+                             scale=scaler is None):
+        cached += item.cached
+        if item.error:
+            failures += 1
+            print(f'Skipping {item.filename}: {item.error}')
+            continue
+        all_features.append(item.features if scaler is None else item.vector)
+        all_labels.append(item.label)
+        if store is not None:
+            try:
+                stored_ids.append(item.recording_id)
+                stored_vectors.append(item.vector)
+            except ValueError:
+                print(f'Not storing {item.filename}: no recording id')
+
+    if stored_vectors:
+        store.put_many(stored_ids, np.stack(stored_vectors))
+        print(f'Stored {len(stored_vectors)} feature vectors.')
+    if failures:
+        print(f'{failures} files could not be processed.')
+    if cache is not None:
+        total = len(all_features) + failures
+        ratio = cached / total if total else 0.0
+        print(f'Feature cache: {cached}/{total} files cached '
+              f'(hit ratio {ratio:.1%}).')
+    if scaler is not None:
+        if not all_features:
+            return np.zeros((0, 0), dtype=np.float32), all_labels
+        return scaler.transform(np.stack(all_features)), all_labels
+    return all_features, all_labels
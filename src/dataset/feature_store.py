@@ -0,0 +1,238 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+from pathlib import Path
+
+import numpy as np
+
+from .features import FEATURE_CONFIG_VERSION
+
+# Order of the features in a flat feature vector
+FEATURE_VECTOR_KEYS = ('mfcc_means', 'mfcc_stds', 'centroid_mean',
+                       'centroid_std', 'rolloff_mean', 'rolloff_std',
+                       'rms_mean', 'rms_std')
+
+
+def feature_vector(feature_dict, keys=FEATURE_VECTOR_KEYS):
+    """
+    Flattens a feature dict, e.g. from create_combined_features(), into a
+    float32 vector, in the order of keys.
+    """
+    return np.concatenate([np.ravel(feature_dict[key]) for key in keys]
+                          ).astype(np.float32)
+
+
+def index_path_for(path):
+    """
+    Returns the path of the index sidecar of an exported matrix.
+    """
+    path = Path(path)
+    return path.with_name(path.stem + '.index.npy')
+
+
+class FeatureStore:
+    """
+    Fixed-width float32 feature vectors kept in the recordings database,
+    keyed by (recording_id, segment, version).
+
+    Parameters
+    ----------
+    database
+        DatabaseHandler whose connection is used.
+
+    Notes
+    -----
+    Vectors are stored as raw float32 BLOBs. load() joins the BLOBs of all
+    selected rows and reinterprets them as one (N, D) matrix with
+    np.frombuffer, so no per-row arrays are created. export() writes the
+    matrix to an .npy file with an (N, 2) index sidecar of recording_id
+    and segment, which load_export() opens as a memory map.
+
+    See Also
+    --------
+    feature_vector
+    build_dataset
+    """
+    def __init__(self, database):
+        self.database = database
+        conn = database.connection()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS features("
+                         "recording_id INTEGER,"
+                         "segment INTEGER,"
+                         "version INTEGER,"
+                         "dim INTEGER,"
+                         "vector BLOB,"
+                         "PRIMARY KEY (version, recording_id, segment)"
+                         ")")
+
+    def put_many(self, recording_ids, matrix, segments=None,
+                 version=FEATURE_CONFIG_VERSION):
+        """
+        Stores many vectors in one transaction, replacing existing ones.
+
+        Parameters
+        ----------
+        recording_ids
+            Recording id per row of matrix.
+        matrix
+            Feature vectors, shape (N, D).
+        segments
+            Segment number per row, defaults to 0 (whole recording).
+        version
+            Feature set version, defaults to FEATURE_CONFIG_VERSION.
+
+        Returns
+        -------
+        int
+            Number of stored vectors.
+        """
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if matrix.ndim != 2:
+            raise ValueError('matrix must have shape (N, D)')
+        if segments is None:
+            segments = np.zeros(len(matrix), dtype=np.int64)
+        rows = ((int(recording_id), int(segment), int(version),
+                 matrix.shape[1], row.tobytes())
+                for recording_id, segment, row
+                in zip(recording_ids, segments, matrix))
+        conn = self.database.connection()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO features (recording_id, "
+                             "segment, version, dim, vector) "
+                             "VALUES (?, ?, ?, ?, ?)", rows)
+        return len(matrix)
+
+    def put(self, recording_id, vector, segment=0,
+            version=FEATURE_CONFIG_VERSION):
+        """
+        Stores a single vector, see put_many().
+        """
+        self.put_many([recording_id], np.reshape(vector, (1, -1)), [segment],
+                      version)
+
+    def _select(self, version, recording_ids=None):
+        sql = ("SELECT recording_id, segment, dim, vector FROM features "
+               "WHERE version = ?")
+        params = [int(version)]
+        if recording_ids is not None:
+            ids = [int(recording_id) for recording_id in recording_ids]
+            sql += (" AND recording_id IN (SELECT value FROM json_each(?))")
+            params.append(str(ids))
+        sql += " ORDER BY recording_id, segment"
+        return self.database.connection().execute(sql, params)
+
+    def load(self, recording_ids=None, version=FEATURE_CONFIG_VERSION):
+        """
+        Reads vectors into a single matrix.
+
+        Parameters
+        ----------
+        recording_ids
+            Recordings to read, all if None.
+        version
+            Feature set version, defaults to FEATURE_CONFIG_VERSION.
+
+        Returns
+        -------
+        np.ndarray
+            Index of shape (N, 2), recording_id and segment per row.
+        np.ndarray
+            Feature matrix of shape (N, D), float32, sorted like the index.
+        """
+        rows = self._select(version, recording_ids).fetchall()
+        if not rows:
+            return np.zeros((0, 2), dtype=np.int64), np.zeros((0, 0), np.float32)
+        recording_ids, segments, dims, blobs = zip(*rows)
+        if len(set(dims)) > 1:
+            raise ValueError(f'Vectors of version {version} have different '
+                             f'lengths: {sorted(set(dims))}')
+        index = np.column_stack([recording_ids, segments]).astype(np.int64)
+        matrix = np.frombuffer(b''.join(blobs), dtype=np.float32)
+        return index, matrix.reshape(len(rows), dims[0])
+
+    def count(self, version=FEATURE_CONFIG_VERSION):
+        return self.database.connection().execute(
+            "SELECT count(*) FROM features WHERE version = ?",
+            (int(version),)).fetchone()[0]
+
+    def export(self, path, version=FEATURE_CONFIG_VERSION, chunk_size=65536):
+        """
+        Writes all vectors of a version to an .npy file, chunk by chunk,
+        with an index sidecar (see index_path_for()).
+
+        Parameters
+        ----------
+        path
+            Target .npy file.
+        version
+            Feature set version, defaults to FEATURE_CONFIG_VERSION.
+        chunk_size
+            Number of rows read from the database at a time.
+
+        Returns
+        -------
+        tuple
+            Shape of the exported matrix.
+        """
+        path = Path(path)
+        n_rows = self.count(version)
+        cursor = self._select(version)
+        first = cursor.fetchone()
+        dim = first[2] if first else 0
+        matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                           shape=(n_rows, dim))
+        index = np.zeros((n_rows, 2), dtype=np.int64)
+
+        position = 0
+        rows = [first] if first else []
+        while rows:
+            if any(row[2] != dim for row in rows):
+                raise ValueError(f'Vectors of version {version} have '
+                                 f'different lengths')
+            end = position + len(rows)
+            index[position:end] = [(row[0], row[1]) for row in rows]
+            matrix[position:end] = np.frombuffer(
+                b''.join(row[3] for row in rows), dtype=np.float32
+            ).reshape(len(rows), dim)
+            position = end
+            rows = cursor.fetchmany(chunk_size)
+
+        matrix.flush()
+        del matrix
+        np.save(index_path_for(path), index)
+        return n_rows, dim
+
+    @staticmethod
+    def load_export(path, mmap=True):
+        """
+        Opens a matrix written by export().
+
+        Parameters
+        ----------
+        path
+            Exported .npy file.
+        mmap
+            If True (default), the matrix is memory-mapped read-only.
+
+        Returns
+        -------
+        np.ndarray
+            Index of shape (N, 2), recording_id and segment per row.
+        np.ndarray
+            Feature matrix of shape (N, D).
+        """
+        matrix = np.load(path, mmap_mode='r' if mmap else None)
+        return np.load(index_path_for(path)), matrix
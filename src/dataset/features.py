@@ -0,0 +1,354 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import librosa
+import librosa.feature
+
+from src.audio_processing.segmentation import detect_events, intervals_to_mask
+from src.core.feature_cache import FEATURE_CONFIG_VERSION
+
+N_FFT = 2048
+HOP_LENGTH = 512
+MFCC_N_FFT = 512
+MFCC_HOP_LENGTH = 512
+
+
+@dataclass(frozen=True)
+class Feature:
+    """
+    Node of the feature graph.
+
+    Parameters
+    ----------
+    name: str
+        Name of the feature or intermediate.
+    depends: tuple
+        Names of the nodes this one is computed from. 'y' is the raw audio
+        signal.
+    compute: Callable
+        Function called as compute(sr, *dependencies).
+    summarize: bool
+        If True, mean and std over time are reported for this node.
+    hop_length: int
+        Hop length of the frames of this node, used to map segments onto
+        frames.
+    """
+    name: str
+    depends: tuple
+    compute: Callable
+    summarize: bool = True
+    hop_length: int = HOP_LENGTH
+
+
+FEATURES = {}
+
+
+def register_feature(name, depends, summarize=True, hop_length=HOP_LENGTH):
+    """
+    Decorator adding a function to the feature registry.
+
+    Parameters
+    ----------
+    name
+        Name of the feature.
+    depends
+        Tuple of node names the function takes as positional arguments
+        after sr.
+    summarize
+        Whether the feature ends up in the summary statistics.
+    hop_length
+        Hop length of the feature's frames.
+
+    Returns
+    -------
+    Callable
+        The decorated function, unchanged.
+    """
+    def decorator(func):
+        FEATURES[name] = Feature(name, tuple(depends), func, summarize,
+                                 hop_length)
+        return func
+    return decorator
+
+
+@register_feature('magnitude', ('y',), summarize=False)
+def _magnitude(sr, y):
+    return np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH))
+
+
+@register_feature('mfcc_power', ('y',), summarize=False,
+                  hop_length=MFCC_HOP_LENGTH)
+def _mfcc_power(sr, y):
+    return np.abs(librosa.stft(y, n_fft=MFCC_N_FFT,
+                               hop_length=MFCC_HOP_LENGTH)) ** 2
+
+
+@register_feature('mel', ('mfcc_power',), summarize=False,
+                  hop_length=MFCC_HOP_LENGTH)
+def _mel(sr, power):
+    return librosa.feature.melspectrogram(S=power, sr=sr, n_fft=MFCC_N_FFT,
+                                          fmin=4000, fmax=8000)
+
+
+@register_feature('mfcc', ('mel',), hop_length=MFCC_HOP_LENGTH)
+def _mfcc(sr, mel):
+    return librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=8)
+
+
+@register_feature('centroid', ('magnitude',))
+def _centroid(sr, magnitude):
+    return librosa.feature.spectral_centroid(S=magnitude, sr=sr)[0]
+
+
+@register_feature('bandwidth', ('magnitude',))
+def _bandwidth(sr, magnitude):
+    return librosa.feature.spectral_bandwidth(S=magnitude, sr=sr)[0]
+
+
+@register_feature('rolloff', ('magnitude',))
+def _rolloff(sr, magnitude):
+    return librosa.feature.spectral_rolloff(S=magnitude, sr=sr)[0]
+
+
+@register_feature('rms', ('magnitude',))
+def _rms(sr, magnitude):
+    # RMS of the windowed frames, rescaled by the window energy so values
+    # stay comparable to the time-domain librosa.feature.rms(y=y)
+    window_gain = np.sqrt(np.mean(librosa.filters.get_window('hann', N_FFT) ** 2))
+    return librosa.feature.rms(S=magnitude, frame_length=N_FFT)[0] / window_gain
+
+
+@register_feature('zcr', ('y',))
+def _zcr(sr, y):
+    return librosa.feature.zero_crossing_rate(y, frame_length=N_FFT,
+                                              hop_length=HOP_LENGTH)[0]
+
+
+class FeatureExtractor:
+    """
+    Computes a set of registered features, evaluating every shared
+    intermediate (e.g. the STFT) once per clip.
+
+    Parameters
+    ----------
+    features
+        Names of the features to compute. Their dependencies are resolved
+        from the registry.
+
+    Notes
+    -----
+    Summary statistics are named <feature>_mean/<feature>_std for 1-D
+    features and <feature>_means/<feature>_stds for 2-D features such as
+    MFCCs. Cumulative per-node timings are collected in self.timings.
+
+    With segments='auto', calls are detected on the shared magnitude
+    spectrogram and statistics only cover frames inside detected calls.
+
+    See Also
+    --------
+    register_feature
+    create_combined_features
+    """
+    def __init__(self, features=('mfcc', 'centroid', 'rolloff', 'rms')):
+        self.features = tuple(features)
+        self.order = self._resolve(self.features)
+        self.timings = {name: 0.0 for name in self.order}
+        self.n_clips = 0
+
+    @staticmethod
+    def _resolve(features):
+        """
+        Orders the requested features and their dependencies so every
+        node comes after the nodes it depends on.
+        """
+        order = []
+        visiting = set()
+
+        def visit(name):
+            if name == 'y' or name in order:
+                return
+            if name not in FEATURES:
+                raise KeyError(f"Unknown feature: {name}")
+            if name in visiting:
+                raise ValueError(f"Circular feature dependency at {name}")
+            visiting.add(name)
+            for dependency in FEATURES[name].depends:
+                visit(dependency)
+            visiting.discard(name)
+            order.append(name)
+
+        for feature_name in features:
+            visit(feature_name)
+        return order
+
+    def _value(self, name, values, sr):
+        """
+        Returns a node's value, computing it and its dependencies once.
+        """
+        if name not in values:
+            node = FEATURES[name]
+            arguments = [self._value(d, values, sr) for d in node.depends]
+            start = time.perf_counter()
+            values[name] = node.compute(sr, *arguments)
+            self.timings[name] = (self.timings.get(name, 0.0)
+                                  + time.perf_counter() - start)
+        return values[name]
+
+    def _evaluate(self, y, sr):
+        values = {'y': y}
+        for name in self.order:
+            self._value(name, values, sr)
+        self.n_clips += 1
+        return values
+
+    def compute(self, y, sr):
+        """
+        Evaluates the feature graph for one clip.
+
+        Parameters
+        ----------
+        y
+            Audio signal, from librosa.load()
+        sr
+            Sampling rate, in Hz.
+
+        Returns
+        -------
+        dict
+            Framewise values of every requested feature.
+        """
+        values = self._evaluate(y, sr)
+        return {name: values[name] for name in self.features}
+
+    def summarize(self, values, sr=None, segments=None):
+        """
+        Computes mean and standard deviation over time of framewise
+        features. Features with the same number of frames are stacked and
+        reduced together.
+
+        Parameters
+        ----------
+        values
+            Output of compute().
+        sr
+            Sampling rate, in Hz. Required with segments.
+        segments
+            Optional intervals in seconds, shape (n_events, 2). Only
+            frames inside them are summarized. If no frame lies inside,
+            all frames are used.
+
+        Returns
+        -------
+        dict
+            Summary statistics per feature.
+        """
+        groups = {}
+        for name, value in values.items():
+            if FEATURES[name].summarize:
+                rows = np.atleast_2d(value)
+                if segments is not None and len(segments):
+                    mask = intervals_to_mask(segments, rows.shape[-1], sr,
+                                             FEATURES[name].hop_length)
+                    if mask.any():
+                        rows = rows[:, mask]
+                groups.setdefault(rows.shape[-1], []).append((name, rows))
+
+        summary = {}
+        for group in groups.values():
+            stacked = np.vstack([rows for _, rows in group])
+            means = stacked.mean(axis=1)
+            stds = stacked.std(axis=1)
+            row = 0
+            for name, rows in group:
+                n_rows = rows.shape[0]
+                if np.ndim(values[name]) == 1:
+                    summary[f'{name}_mean'] = means[row]
+                    summary[f'{name}_std'] = stds[row]
+                else:
+                    summary[f'{name}_means'] = means[row:row + n_rows]
+                    summary[f'{name}_stds'] = stds[row:row + n_rows]
+                row += n_rows
+        return summary
+
+    def extract(self, y, sr, segments=None):
+        """
+        Computes the features of a clip and returns their summary
+        statistics.
+
+        Parameters
+        ----------
+        y
+            Audio signal, from librosa.load()
+        sr
+            Sampling rate, in Hz.
+        segments
+            None summarizes all frames. An array of intervals in seconds,
+            or 'auto' to detect calls with detect_events() on the shared
+            magnitude spectrogram, restricts statistics to those intervals.
+
+        Returns
+        -------
+        dict
+            Summary statistics per feature, see summarize().
+        """
+        values = self._evaluate(y, sr)
+        if isinstance(segments, str) and segments == 'auto':
+            magnitude = self._value('magnitude', values, sr)
+            start = time.perf_counter()
+            segments = detect_events(magnitude ** 2, sr, hop_length=HOP_LENGTH)
+            self.timings['segments'] = (self.timings.get('segments', 0.0)
+                                        + time.perf_counter() - start)
+        values = {name: values[name] for name in self.features}
+        start = time.perf_counter()
+        summary = self.summarize(values, sr, segments)
+        self.timings['summary'] = (self.timings.get('summary', 0.0)
+                                   + time.perf_counter() - start)
+        return summary
+
+    def merge_timings(self, timings, n_clips):
+        """
+        Adds timings collected by another extractor, e.g. in a worker
+        process, to this one.
+
+        Parameters
+        ----------
+        timings
+            Seconds per node, as in self.timings.
+        n_clips
+            Number of clips the timings were collected over.
+        """
+        for name, seconds in timings.items():
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+        self.n_clips += n_clips
+
+    def report_timings(self):
+        """
+        Prints total and per-clip time spent on each node of the graph.
+
+        Returns
+        -------
+        dict
+            Total seconds per node.
+        """
+        print(f'Feature timings over {self.n_clips} clips:')
+        for name, seconds in self.timings.items():
+            per_clip = seconds / self.n_clips * 1000 if self.n_clips else 0.0
+            print(f'  {name:<12} {seconds:8.3f} s  {per_clip:8.2f} ms/clip')
+        return dict(self.timings)
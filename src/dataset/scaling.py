@@ -0,0 +1,164 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+
+
+class StreamingScaler:
+    """
+    Dataset-level standardization with per-feature mean and variance
+    accumulated incrementally, so it can be fitted on data that does not
+    fit in memory.
+
+    Attributes
+    ----------
+    n_samples: int
+        Number of samples seen.
+    mean: np.ndarray
+        Mean per feature, shape (D,).
+    m2: np.ndarray
+        Sum of squared deviations from the mean per feature, shape (D,).
+
+    Notes
+    -----
+    Each batch is reduced to (count, mean, m2) with NumPy and combined with
+    the running statistics using the parallel update of Chan et al., which
+    is numerically stable and exact up to rounding. Scalers fitted on
+    different parts of a dataset, e.g. in separate workers, can be
+    combined with merge() and give the same statistics as fitting on all
+    of it. The variance is the population variance, as in
+    sklearn.preprocessing.StandardScaler.
+
+    See Also
+    --------
+    build_dataset
+    """
+    def __init__(self):
+        self.n_samples = 0
+        self.mean = None
+        self.m2 = None
+
+    def _combine(self, n_samples, mean, m2):
+        if n_samples == 0:
+            return self
+        if self.n_samples == 0:
+            self.n_samples = n_samples
+            self.mean = np.array(mean, dtype=np.float64)
+            self.m2 = np.array(m2, dtype=np.float64)
+            return self
+        if mean.shape != self.mean.shape:
+            raise ValueError(f'Expected {self.mean.shape[0]} features, '
+                             f'got {mean.shape[0]}')
+        total = self.n_samples + n_samples
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (n_samples / total)
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.n_samples * n_samples / total)
+        self.n_samples = total
+        return self
+
+    def partial_fit(self, X):
+        """
+        Updates the statistics with a batch of samples.
+
+        Parameters
+        ----------
+        X
+            Samples, shape (N, D), or a single sample of shape (D,).
+
+        Returns
+        -------
+        StreamingScaler
+            self
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[np.newaxis]
+        if len(X) == 0:
+            return self
+        mean = X.mean(axis=0)
+        return self._combine(len(X), mean, ((X - mean) ** 2).sum(axis=0))
+
+    def fit(self, batches):
+        """
+        Fits on an iterable of (N, D) batches, see partial_fit().
+        """
+        for X in batches:
+            self.partial_fit(X)
+        return self
+
+    def merge(self, other):
+        """
+        Adds the statistics of another scaler to this one.
+
+        Returns
+        -------
+        StreamingScaler
+            self
+        """
+        return self._combine(other.n_samples, other.mean, other.m2)
+
+    @property
+    def var(self):
+        return self.m2 / self.n_samples
+
+    @property
+    def scale(self):
+        """
+        Standard deviation per feature, 1 for constant features.
+        """
+        std = np.sqrt(self.var)
+        return np.where(std > 0, std, 1.0)
+
+    def transform(self, X, dtype=np.float32):
+        """
+        Standardizes samples with the fitted statistics.
+
+        Parameters
+        ----------
+        X
+            Samples, shape (N, D) or (D,).
+        dtype
+            Output dtype, defaults to float32.
+
+        Returns
+        -------
+        np.ndarray
+            (X - mean) / scale, same shape as X.
+        """
+        if self.n_samples == 0:
+            raise ValueError('StreamingScaler is not fitted')
+        X = np.asarray(X)
+        return ((X - self.mean) / self.scale).astype(dtype, copy=False)
+
+    def inverse_transform(self, X):
+        return np.asarray(X) * self.scale + self.mean
+
+    def save(self, path):
+        """
+        Writes the statistics to an .npz file.
+        """
+        if self.n_samples == 0:
+            raise ValueError('StreamingScaler is not fitted')
+        np.savez(path, n_samples=self.n_samples, mean=self.mean, m2=self.m2)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a scaler written by save().
+        """
+        with np.load(path) as data:
+            scaler = cls()
+            return scaler._combine(int(data['n_samples']), data['mean'],
+                                   data['m2'])
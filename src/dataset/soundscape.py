@@ -0,0 +1,271 @@
+#  bioacoustics
+#  Copyright (C) 2025 CatraMyBeloved
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+import librosa
+
+from src.audio_processing.segmentation import detect_events
+from src.core.audio_store import audio_duration, load_audio
+from src.core.parallel import imap_bounded
+
+
+@dataclass
+class WindowResult:
+    """
+    Output of the per-window function for one window.
+
+    Parameters
+    ----------
+    filename: str
+        Path to the recording.
+    offset: float
+        Start of the window, in seconds.
+    duration: float
+        Length of the window, in seconds.
+    value: Any
+        Return value of the per-window function, None on failure.
+    error: str
+        Error message if the window failed, else None.
+    """
+    filename: str
+    offset: float
+    duration: float
+    value: Any = None
+    error: str = None
+
+
+@dataclass
+class SoundscapeResult:
+    """
+    Merged output of SlidingWindowEngine for one recording.
+
+    Parameters
+    ----------
+    filename: str
+        Path to the recording.
+    duration: float
+        Length of the recording, in seconds.
+    windows: list
+        WindowResult per window, in time order.
+    events: np.ndarray
+        De-duplicated events with absolute times in seconds, shape
+        (n_events, n_columns). Only filled in events mode.
+    """
+    filename: str
+    duration: float
+    windows: list = field(default_factory=list)
+    events: np.ndarray = None
+
+    @property
+    def errors(self):
+        return [window for window in self.windows if window.error]
+
+
+def window_events(y, sr, offset):
+    """
+    Per-window function detecting calls with detect_events(), for use
+    with SlidingWindowEngine.
+
+    Parameters
+    ----------
+    y
+        Audio of the window.
+    sr
+        Sampling rate, in Hz.
+    offset
+        Start of the window in the recording, in seconds.
+
+    Returns
+    -------
+    np.ndarray
+        Call intervals relative to the window start, shape (n_events, 2).
+    """
+    power = np.abs(librosa.stft(np.asarray(y), hop_length=512)) ** 2
+    return detect_events(power, sr, hop_length=512)
+
+
+def merge_events(events):
+    """
+    Merges overlapping events, keeping the extra columns of the first.
+
+    Parameters
+    ----------
+    events
+        Events sorted by start time, shape (n_events, n_columns) with start
+        and end in the first two columns.
+
+    Returns
+    -------
+    np.ndarray
+        Events without overlaps.
+    """
+    if len(events) < 2:
+        return events
+    running_end = np.maximum.accumulate(events[:, 1])
+    new_group = np.concatenate([[True], events[1:, 0] > running_end[:-1]])
+    group_starts = np.flatnonzero(new_group)
+    merged = events[group_starts].copy()
+    merged[:, 1] = np.maximum.reduceat(events[:, 1], group_starts)
+    return merged
+
+
+def _run_window(task):
+    filename, offset, duration, func, sr, store = task
+    try:
+        y, sr = load_audio(filename, sr, offset=offset, duration=duration,
+                           store=store)
+        return WindowResult(filename, offset, duration, func(y, sr, offset))
+    except Exception as e:
+        return WindowResult(filename, offset, duration,
+                            error=f'{type(e).__name__}: {e}')
+
+
+class SlidingWindowEngine:
+    """
+    Runs a function over overlapping windows of long recordings in a
+    process pool. Every worker only loads its own window, so recordings
+    longer than memory can be processed.
+
+    Parameters
+    ----------
+    window
+        Window length, in seconds.
+    overlap
+        Overlap between consecutive windows in seconds. Should be longer
+        than the longest expected event.
+    sr
+        Sampling rate to load audio with, in Hz.
+    n_workers
+        Number of worker processes. None uses all cores, 1 runs serially.
+    store
+        AudioStore to read windows from, see core.audio_store.load_audio().
+
+    Notes
+    -----
+    The per-window function is called as func(y, sr, offset) and must be
+    picklable, i.e. defined at module level. In events mode, it returns an
+    array of shape (n_events, n_columns) whose first two columns are start
+    and end relative to the window. Each window owns the timeline from the
+    middle of its overlap with the previous window to the middle of its
+    overlap with the next one. Events are kept by the window owning their
+    midpoint, and any remaining overlapping events are merged.
+
+    See Also
+    --------
+    window_events
+    core.recording_file.iter_windows
+    """
+    def __init__(self, window=60.0, overlap=5.0, sr=22050, n_workers=None,
+                 store=None):
+        if not 0 <= overlap < window:
+            raise ValueError('overlap must be in [0, window)')
+        self.window = window
+        self.overlap = overlap
+        self.sr = sr
+        self.n_workers = n_workers
+        self.store = store
+
+    def window_offsets(self, duration):
+        """
+        Returns the start of every window for a recording of given length.
+        """
+        hop = self.window - self.overlap
+        n_windows = max(1, int(np.ceil((duration - self.overlap) / hop)))
+        return np.arange(n_windows) * hop
+
+    def _tasks(self, durations, func):
+        for filename, duration in durations.items():
+            for offset in self.window_offsets(duration):
+                length = min(self.window, duration - offset)
+                yield (filename, float(offset), float(length), func, self.sr,
+                       self.store)
+
+    def _merge(self, result):
+        hop = self.window - self.overlap
+        collected = []
+        for window in result.windows:
+            if window.error or window.value is None or len(window.value) == 0:
+                continue
+            values = np.array(window.value, dtype=float, ndmin=2)
+            values[:, :2] += window.offset
+            own_start = window.offset + self.overlap / 2 if window.offset > 0 else -np.inf
+            own_end = window.offset + hop + self.overlap / 2
+            if window.offset + self.window >= result.duration:
+                own_end = np.inf
+            midpoints = values[:, :2].mean(axis=1)
+            collected.append(values[(midpoints >= own_start) & (midpoints < own_end)])
+
+        if not collected:
+            return np.zeros((0, 2))
+        merged = np.concatenate(collected)
+        return merge_events(merged[np.argsort(merged[:, 0], kind='stable')])
+
+    def run_many(self, filenames, func=window_events, events=True):
+        """
+        Processes several recordings, sharing one process pool across all
+        of their windows.
+
+        Parameters
+        ----------
+        filenames
+            Paths to recordings.
+        func
+            Per-window function, defaults to window_events.
+        events
+            If True, window results are treated as events and merged.
+
+        Returns
+        -------
+        dict
+            SoundscapeResult per filename.
+        """
+        start = time.perf_counter()
+        durations = {filename: audio_duration(filename, self.sr, self.store)
+                     for filename in filenames}
+        results = {filename: SoundscapeResult(filename, duration)
+                   for filename, duration in durations.items()}
+
+        for window in imap_bounded(_run_window, self._tasks(durations, func),
+                                   n_workers=self.n_workers, ordered=False):
+            if window.error:
+                print(f'Window {window.offset:.1f}s of {window.filename} '
+                      f'failed: {window.error}')
+            results[window.filename].windows.append(window)
+
+        for result in results.values():
+            result.windows.sort(key=lambda w: w.offset)
+            if events:
+                result.events = self._merge(result)
+
+        elapsed = time.perf_counter() - start
+        audio_hours = sum(durations.values()) / 3600
+        rate = audio_hours / (elapsed / 60) if elapsed else float('inf')
+        print(f'Processed {audio_hours:.2f} h of audio in {elapsed / 60:.2f} '
+              f'min ({rate:.2f} audio-hours per minute).')
+        return results
+
+    def run(self, filename, func=window_events, events=True):
+        """
+        Processes a single recording, see run_many().
+
+        Returns
+        -------
+        SoundscapeResult
+        """
+        return self.run_many([filename], func, events)[filename]
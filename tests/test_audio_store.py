@@ -0,0 +1,29 @@
+import numpy as np
+import librosa
+import pytest
+import soundfile as sf
+
+from src.core import AudioStore, stream_audio
+
+
+@pytest.mark.parametrize('native_sr', [44100, 48000])
+@pytest.mark.parametrize('offset, duration', [(0.0, None), (1.3, 7.7)])
+def test_stream_matches_batch_when_resampling(tmp_path, native_sr, offset,
+                                               duration):
+    rng = np.random.default_rng(0)
+    t = np.arange(native_sr * 12) / native_sr
+    y = 0.3 * np.sin(2 * np.pi * 3000 * t) + 0.1 * rng.standard_normal(len(t))
+    filename = tmp_path / 'recording.wav'
+    sf.write(filename, y.astype(np.float32), native_sr)
+    store = AudioStore(tmp_path / 'store', sr=22050)
+
+    streamed = np.concatenate(list(stream_audio(
+        filename, 22050, block_duration=5, offset=offset, duration=duration,
+        store=store)))
+    batch, _ = librosa.load(filename, sr=22050)
+    start = int(round(offset * 22050))
+    stop = None if duration is None else start + int(round(duration * 22050))
+    batch = batch[start:stop]
+
+    assert len(streamed) == len(batch)
+    np.testing.assert_allclose(streamed, batch, atol=1e-5)
@@ -0,0 +1,15 @@
+from src.database import DatabaseHandler
+
+
+def test_closing_a_connection_keeps_the_handler_usable(tmp_path):
+    with DatabaseHandler(tmp_path / 'recordings.db') as db:
+        conn = db.create_and_connect()
+        assert conn is not db.connection()
+        conn.close()
+
+        db.upload_audio_stats([{'recording_id': 1, 'duration': 2.0,
+                                'sample_rate': 22050, 'rms': 0.1,
+                                'peak': 0.5, 'clip_ratio': 0.0,
+                                'noise_floor_db': -60.0, 'snr_db': 20.0,
+                                'active_fraction': 0.3}])
+        assert db.analyzed_recordings() == {1}
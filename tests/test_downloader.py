@@ -0,0 +1,215 @@
+import http.server
+import re
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from src.data_acquisition import Downloader, XenoCantoAPI, XenoCantoRecording
+
+DATA = bytes(range(256)) * 40
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """Serves DATA with ETag "v1", honouring Range and If-Range."""
+    etag = '"v1"'
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        # No Content-Length, as for a chunked response
+        type(self).requests.append(dict(self.headers, method='HEAD'))
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+
+    def do_GET(self):
+        type(self).requests.append(dict(self.headers))
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if match and int(match.group(1)) >= len(DATA):
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(DATA)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if match and (if_range is None or if_range == self.etag):
+            start = int(match.group(1))
+            body = DATA[start:]
+            self.send_response(206)
+            self.send_header('Content-Range',
+                             f'bytes {start}-{len(DATA) - 1}/{len(DATA)}')
+        else:
+            body = DATA
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class SlowHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves DATA slowly, recording request start times and the number of
+    requests in flight. Paths starting with /truncated send half the body
+    and close the connection.
+    """
+    lock = threading.Lock()
+    starts = []
+    active = 0
+    max_active = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.starts.append(time.monotonic())
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(DATA)))
+            self.end_headers()
+            time.sleep(0.2)
+            if self.path.startswith('/truncated'):
+                self.wfile.write(DATA[:len(DATA) // 2])
+                self.wfile.flush()
+                self.close_connection = True
+            else:
+                self.wfile.write(DATA)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+
+def serve(handler):
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd, f'http://127.0.0.1:{httpd.server_port}'
+
+
+@pytest.fixture
+def server():
+    RangeHandler.requests = []
+    httpd, url = serve(RangeHandler)
+    yield url + '/file'
+    httpd.shutdown()
+
+
+@pytest.fixture
+def slow_server():
+    SlowHandler.starts = []
+    SlowHandler.active = SlowHandler.max_active = 0
+    httpd, url = serve(SlowHandler)
+    yield url
+    httpd.shutdown()
+
+
+def make_recording(url, recording_id=1):
+    return XenoCantoRecording(recording_id, 'Turdus', 'merula', '', 'birds',
+                              'Blackbird', 'Germany', 'x', None, None, 'song',
+                              'male', 'adult', url, 'A', 30,
+                              datetime(2020, 1, 1), [])
+
+
+def test_resume_sends_if_range_with_stored_etag(server, tmp_path):
+    recording = make_recording(server)
+    path = tmp_path / recording.build_filename()
+    path.with_name(path.name + '.part').write_bytes(DATA[:1000])
+
+    result = Downloader(tmp_path, rate=100).download(
+        recording, {'size': len(DATA), 'etag': '"v1"', 'completed': False})
+
+    assert result.error is None
+    assert result.resumed_from == 1000
+    assert RangeHandler.requests[-1]['Range'] == 'bytes=1000-'
+    assert RangeHandler.requests[-1]['If-Range'] == '"v1"'
+    assert path.read_bytes() == DATA
+
+
+def test_resume_restarts_when_etag_changed(server, tmp_path):
+    recording = make_recording(server)
+    path = tmp_path / recording.build_filename()
+    path.with_name(path.name + '.part').write_bytes(b'\xff' * 1000)
+
+    result = Downloader(tmp_path, rate=100).download(
+        recording, {'size': len(DATA), 'etag': '"v0"', 'completed': False})
+
+    assert result.error is None
+    assert result.resumed_from == 0
+    assert path.read_bytes() == DATA
+
+
+@pytest.mark.parametrize('existing', [DATA[:1000], DATA])
+def test_unverified_file_is_resumed_not_trusted(server, tmp_path, existing):
+    recording = make_recording(server)
+    path = tmp_path / recording.build_filename()
+    path.write_bytes(existing)
+
+    result = Downloader(tmp_path, rate=100).download(recording)
+
+    assert result.error is None
+    assert result.resumed_from == len(existing)
+    assert result.size == len(DATA)
+    assert RangeHandler.requests[-1]['Range'] == f'bytes={len(existing)}-'
+    assert path.read_bytes() == DATA
+    assert not path.with_name(path.name + '.part').exists()
+
+
+def test_download_all_runs_concurrently(slow_server, tmp_path):
+    recordings = [make_recording(f'{slow_server}/{i}', i) for i in range(1, 9)]
+
+    results = list(Downloader(tmp_path, max_workers=4, rate=100, burst=4)
+                   .download_all(recordings))
+
+    assert all(result.error is None for result in results)
+    assert SlowHandler.max_active > 1
+    for recording in recordings:
+        assert (tmp_path / recording.build_filename()).read_bytes() == DATA
+
+
+def test_download_all_respects_rate_limit(slow_server, tmp_path):
+    recordings = [make_recording(f'{slow_server}/{i}', i) for i in range(1, 7)]
+
+    list(Downloader(tmp_path, max_workers=4, rate=10, burst=1)
+         .download_all(recordings))
+
+    starts = sorted(SlowHandler.starts)
+    assert len(starts) == 6
+    # One request at once, then one per 0.1 s
+    assert starts[-1] - starts[0] >= 0.45
+
+
+def test_download_only_renames_complete_files(slow_server, tmp_path):
+    complete = make_recording(f'{slow_server}/complete', 1)
+    truncated = make_recording(f'{slow_server}/truncated', 2)
+    downloader = Downloader(tmp_path, rate=100)
+
+    assert downloader.download(complete).error is None
+    result = downloader.download(truncated)
+
+    path = tmp_path / complete.build_filename()
+    assert path.read_bytes() == DATA
+    assert not path.with_name(path.name + '.part').exists()
+    path = tmp_path / truncated.build_filename()
+    assert result.error is not None
+    assert not path.exists()
+    assert path.with_name(path.name + '.part').exists()
+
+
+def test_recordings_share_the_api_rate_limit(slow_server, tmp_path):
+    api = XenoCantoAPI(rate=2)
+    for i in range(1, 4):
+        api.download_recording(make_recording(f'{slow_server}/{i}', i),
+                               tmp_path)
+
+    starts = sorted(SlowHandler.starts)
+    assert len(starts) == 3
+    # Each transfer takes 0.2 s, the shared limit allows one per 0.5 s
+    assert min(b - a for a, b in zip(starts, starts[1:])) >= 0.45
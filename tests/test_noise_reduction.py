@@ -0,0 +1,36 @@
+import numpy as np
+import librosa
+
+from src.audio_processing import NoiseFloorTracker, estimate_noise_floor
+
+
+def white_noise_power(seconds=20, sr=22050, seed=0):
+    rng = np.random.default_rng(seed)
+    y = rng.standard_normal(seconds * sr).astype(np.float32)
+    # Edge bins of a real signal's spectrum are not exponentially distributed
+    return (np.abs(librosa.stft(y)) ** 2)[5:-5]
+
+
+def test_percentile_floor_matches_noise_power():
+    power = white_noise_power()
+    floor = estimate_noise_floor(power, method='percentile')
+    assert abs(floor.mean() / power.mean() - 1) < 0.1
+
+
+def test_minimum_statistics_floor_matches_noise_power():
+    power = white_noise_power()
+    floor = estimate_noise_floor(power, method='minimum_statistics')
+    ratio = floor / power.mean()
+    assert abs(ratio[:, 64:].mean() - 1) < 0.1
+    # No startup dip toward zero in the first search window
+    assert ratio[:, :64].mean() > 0.5
+
+
+def test_tracker_matches_batch_estimate():
+    power = white_noise_power(seconds=5)
+    tracker = NoiseFloorTracker()
+    streamed = np.concatenate([tracker.update(power[:, start:start + 37])
+                               for start in range(0, power.shape[1], 37)],
+                              axis=1)
+    batch = estimate_noise_floor(power, method='minimum_statistics')
+    np.testing.assert_allclose(streamed, batch, rtol=1e-6)
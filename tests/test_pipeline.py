@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from src.audio_processing import (DenoisePipeline, SpectralSubstractionStage,
+                                  ThresholdStage, apply_threshold,
+                                  spectral_substraction)
+
+SR = 22050
+
+
+@pytest.fixture
+def y():
+    rng = np.random.default_rng(0)
+    t = np.arange(SR * 4) / SR
+    tone = 20 * np.sin(2 * np.pi * 4000 * t) * (t % 1 < 0.3)
+    return (tone + 0.5 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+@pytest.mark.parametrize('cutoff', [-20, 0, 20])
+def test_threshold_stage_matches_apply_threshold(y, cutoff):
+    expected = apply_threshold(y, SR, cutoff)
+    result = DenoisePipeline([ThresholdStage(cutoff)]).run(y, SR)
+    np.testing.assert_allclose(result, expected, atol=1e-3)
+
+
+@pytest.mark.parametrize('smoothing', [None, 2])
+@pytest.mark.parametrize('method', ['percentile', 'minimum_statistics'])
+def test_substraction_stage_matches_spectral_substraction(y, smoothing,
+                                                          method):
+    expected = spectral_substraction(None, y, SR, smoothing=smoothing,
+                                     noise_method=method)
+    stage = SpectralSubstractionStage(smoothing=smoothing, noise_method=method)
+    result = DenoisePipeline([stage]).run(y, SR)
+    np.testing.assert_allclose(result, expected, atol=1e-3)